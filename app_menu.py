@@ -1,18 +1,27 @@
+import os
+import sys
+
+#the menu runs from the home folder, the host and the libraries the apps share live with
+#the apps, so their folder has to be on the path before any of them is imported
+APP_FOLDER = "/home/eyeay/BEVR BOT APPS"
+if APP_FOLDER not in sys.path:
+    sys.path.insert(0, APP_FOLDER)
+
 import cv2
-import mediapipe as mp
-import numpy as np
 import time
-import subprocess
-import os
-import serial
-from picamera2 import Picamera2
-from luma.core.interface.serial import i2c
-from luma.oled.device import ssd1306
-from luma.core.render import canvas
 from PIL import ImageFont
-
-serial_display = i2c(port=1, address=0x3D)
-device = ssd1306(serial_display)
+import hardware
+import vision
+import preview
+import frameprep
+import gesture
+import display
+import servo
+from host import AppHost
+
+host = AppHost(APP_FOLDER)
+device = hardware.get_device()
+screen = display.get_display()
 font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 20)
 
 def update_oled_icon(index):
@@ -21,62 +30,29 @@ def update_oled_icon(index):
     text_width, text_height = font.getsize(display_text)
     x = (device.width - text_width) // 2
     y = (device.height - text_height) // 2
-    with canvas(device) as draw:
+    with screen.canvas() as draw:
         draw.text((x, y), display_text, fill=255, font=font)
 
 def clear_oled():
-    with canvas(device) as draw:
-        draw.rectangle(device.bounding_box, outline=0, fill=0)
+    screen.clear()
 
 def set_neutral_position():
     try:
-        ser = serial.Serial('/dev/ttyAMA0', 115200, timeout=1)
-        time.sleep(2)
-        command = "90,75,180,0\n"
-        ser.write(command.encode('utf-8'))
-        print("Sent neutral:", command.strip())
-        time.sleep(1)
-        ser.close()
+        servo.move_servos(90, 75, 180, 0)
+        print("Sent neutral: 90,75,180,0")
     except Exception as e:
         print("Could not send neutral servo position:", e)
 
-APP_FOLDER = "/home/eyeay/BEVR BOT APPS"
-APP_LIST = sorted([f for f in os.listdir(APP_FOLDER) if f.endswith(".py")])
+APP_LIST = host.list_apps()
 NUM_APPS = len(APP_LIST)
 SELECTED_INDEX = 0
 
-PINCH_THRESHOLD = 0.04
-FRAME_WIDTH = 640
-FRAME_HEIGHT = 480
+FRAME_WIDTH = hardware.FRAME_WIDTH
+FRAME_HEIGHT = hardware.FRAME_HEIGHT
 
-camera = Picamera2()
-camera.configure(camera.create_still_configuration(main={"size": (FRAME_WIDTH, FRAME_HEIGHT)}))
-camera.start()
-
-mp_hands = mp.solutions.hands
-mp_drawing = mp.solutions.drawing_utils
-hands = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7, max_num_hands=1)
-
-def is_pinch(hand_landmarks):
-    tip = hand_landmarks.landmark[8]
-    thumb = hand_landmarks.landmark[4]
-    distance = np.hypot(tip.x - thumb.x, tip.y - thumb.y)
-    return distance < PINCH_THRESHOLD
-
-def is_fist(hand_landmarks):
-    try:
-        finger_tips = [8, 12, 16, 20]
-        finger_mcps = [5, 9, 13, 17]
-        closed_fingers = 0
-        for tip, mcp in zip(finger_tips, finger_mcps):
-            tip_y = hand_landmarks.landmark[tip].y
-            mcp_y = hand_landmarks.landmark[mcp].y
-            if tip_y - mcp_y > -0.02:
-                closed_fingers += 1
-        return closed_fingers >= 3
-    except Exception as e:
-        print("Error in is_fist:", e)
-        return False
+reader = vision.open_reader(hands=True)
+prep = frameprep.FramePrep()
+gestures = gesture.get_classifier()
 
 def draw_app_menu(image, selected_index):
     spacing = FRAME_WIDTH // NUM_APPS
@@ -88,62 +64,53 @@ def draw_app_menu(image, selected_index):
         cv2.putText(image, f"{i+1}", (center[0]-10, center[1]+10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
 
 def launch_app(index):
-    app_path = os.path.join(APP_FOLDER, APP_LIST[index])
-    print(f"Launching: {app_path}")
+    print(f"Launching: {APP_LIST[index]}")
     clear_oled()
-    subprocess.Popen(["python3", app_path])
-    os._exit(0)
+    t0 = time.time()
+    host.run_app(APP_LIST[index])
+    print(f"Back in menu after {time.time() - t0:.1f}s")
+    set_neutral_position()
+    update_oled_icon(SELECTED_INDEX)
 
 print("Starting app navigator... setting neutral position")
 set_neutral_position()
 time.sleep(2)
 
-last_gesture = None
-gesture_cooldown = 1.0
-last_gesture_time = 0
+#pinch: next app, fist: launch it; the fist is still held when the app returns,
+#so it has to be released before it can launch anything again
+def next_app(event):
+    global SELECTED_INDEX
+    SELECTED_INDEX = (SELECTED_INDEX + 1) % NUM_APPS
+    update_oled_icon(SELECTED_INDEX)
+
+def select_app(event):
+    launch_app(SELECTED_INDEX)
+
+events = gesture.GestureEvents(cooldown=1.0)
+events.on("tap", "pinch", next_app)
+events.on("tap", "fist", select_app)
 
 update_oled_icon(SELECTED_INDEX)
 
 while True:
-    frame = camera.capture_array("main")
-    frame = cv2.flip(frame, 1)
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    results = hands.process(rgb_frame)
-    image = frame.copy()
-    current_time = time.time()
-    gesture = None
-
-    if results.multi_hand_landmarks:
-        hand = results.multi_hand_landmarks[0]
-        mp_drawing.draw_landmarks(image, hand, mp_hands.HAND_CONNECTIONS)
-
-        if is_fist(hand):
-            gesture = "fist"
-        elif is_pinch(hand):
-            gesture = "pinch"
-
-        print("Gesture:", gesture)
-
-        if gesture != last_gesture and current_time - last_gesture_time > gesture_cooldown:
-            if gesture == "pinch":
-                SELECTED_INDEX = (SELECTED_INDEX + 1) % NUM_APPS
-                update_oled_icon(SELECTED_INDEX)
-                last_gesture_time = current_time
-            elif gesture == "fist":
-                launch_app(SELECTED_INDEX)
-
-        last_gesture = gesture
-    else:
-        last_gesture = None
-
-    draw_app_menu(image, SELECTED_INDEX)
-    cv2.putText(image, "Pinch = Next | Fist = Select", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-    cv2.imshow("BEVR App Navigator", image)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
+    frame = reader.read(copy=False)
+    if frame is None:
+        continue
+
+    gesture_name = gestures.classify(frame.hands[0]) if frame.hands else None
+    events.update(gesture_name)
+
+    if preview.wanted():
+        image = prep.bgr(frame.image)
+        if frame.hands:
+            vision.draw_hand(image, frame.hands[0])
+        draw_app_menu(image, SELECTED_INDEX)
+        cv2.putText(image, "Pinch = Next | Fist = Select", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        preview.show("BEVR App Navigator", image)
+    if preview.key() == ord('q'):
         break
 
 clear_oled()
-camera.stop()
-cv2.destroyAllWindows()
+vision.stop_service()
+hardware.close_all()
+preview.close()
@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import numpy as np
+
+HOP = 512  #pcm frames per envelope step, ~12 ms at 44.1 kHz
+CHUNK = 2048  #envelope steps read from the pcm at a time
+MIN_BPM, MAX_BPM = 60, 180
+PREFERRED_BPM = 120  #centre of the tempo prior, keeps half/double tempo guesses in check
+TIGHTNESS = 100  #how strongly beats stick to the tempo against the onsets
+CACHE_FILE = "beats.npz"
+VERSION = 1
+
+#beat times and loudness of one song, looked up by playback position
+class BeatGrid:
+    def __init__(self, beats, envelope, hop, tempo):
+        self.beats = np.asarray(beats, np.float32)
+        self.envelope = np.asarray(envelope, np.float32)
+        self.hop = float(hop)
+        self.tempo = float(tempo)
+        self.period = 60.0 / self.tempo if self.tempo else 0.5
+
+    #index of the last beat at t and how far (0-1) it is towards the next one
+    def beat(self, t):
+        beats = self.beats
+        i = int(np.searchsorted(beats, t, side="right")) - 1
+        if i < 0:
+            return 0, 0.0
+        span = beats[i + 1] - beats[i] if i + 1 < len(beats) else self.period
+        return i, min((t - beats[i]) / span, 1.0)
+
+    #loudness at t, 0-1 over the song
+    def energy(self, t):
+        if not len(self.envelope):
+            return 0.0
+        return float(self.envelope[min(max(int(t / self.hop), 0), len(self.envelope) - 1)])
+
+    def save(self, path):
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, beats=self.beats, envelope=self.envelope, hop=self.hop, tempo=self.tempo, version=VERSION)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != VERSION:
+                return None
+            return cls(data["beats"], data["envelope"], data["hop"], data["tempo"])
+
+#rms of the summed stems per hop, read from the mapped pcm a chunk at a time
+def rms_envelope(pcm, frames, hop=HOP):
+    steps = frames // hop
+    rms = np.empty(steps, np.float32)
+    for start in range(0, steps, CHUNK):
+        end = min(start + CHUNK, steps)
+        mono = np.zeros((end - start) * hop, np.float32)
+        for a in pcm:
+            mono += np.asarray(a[start * hop:end * hop], np.float32).mean(axis=1)
+        rms[start:end] = np.sqrt(np.mean(mono.reshape(-1, hop) ** 2, axis=1))
+    return rms
+
+#rises in log loudness, normalised
+def onset_strength(rms):
+    log = np.log(rms + 1e-3 * (rms.max() + 1e-9))
+    onset = np.maximum(np.diff(log, prepend=log[0]), 0)
+    std = onset.std()
+    return onset / std if std > 0 else onset
+
+#beat period in hops from the autocorrelation of the onsets, weighted towards PREFERRED_BPM
+def beat_period(onset, hop_seconds):
+    n = len(onset)
+    centered = onset - onset.mean()
+    spectrum = np.fft.rfft(centered, 2 * n)
+    ac = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    lags = np.arange(n)
+    lo = max(int(60.0 / MAX_BPM / hop_seconds), 1)
+    hi = min(int(60.0 / MIN_BPM / hop_seconds) + 1, n - 1)
+    if hi <= lo:
+        return 60.0 / PREFERRED_BPM / hop_seconds
+    bpm = 60.0 / (lags[lo:hi] * hop_seconds)
+    prior = np.exp(-0.5 * np.log2(bpm / PREFERRED_BPM) ** 2)
+    return float(lags[lo:hi][np.argmax(ac[lo:hi] * prior)])
+
+#beats through the onsets that keep close to the period, by dynamic programming
+def track_beats(onset, period, tightness=TIGHTNESS):
+    n = len(onset)
+    window = np.arange(-int(round(2 * period)), -int(round(period / 2)) + 1)
+    cost = -tightness * np.log(-window / period) ** 2
+    score = onset.astype(np.float64).copy()
+    back = np.full(n, -1)
+    for t in range(n):
+        prev = t + window
+        valid = prev >= 0
+        if not valid.any():
+            continue
+        candidates = score[prev[valid]] + cost[valid]
+        k = int(np.argmax(candidates))
+        if candidates[k] > 0:
+            score[t] = onset[t] + candidates[k]
+            back[t] = prev[valid][k]
+    tail = max(n - int(period), 0)
+    t = tail + int(np.argmax(score[tail:])) if n else -1
+    beats = []
+    while t >= 0:
+        beats.append(t)
+        t = back[t]
+    return np.array(beats[::-1], np.int64)
+
+def analyze(song, hop=HOP):
+    t0 = time.time()
+    rms = rms_envelope(list(song.pcm.values()), song.frames, hop)
+    hop_seconds = hop / song.rate
+    onset = onset_strength(rms)
+    period = beat_period(onset, hop_seconds)
+    beats = track_beats(onset, period) * hop_seconds
+    envelope = rms / rms.max() if len(rms) and rms.max() > 0 else rms
+    grid = BeatGrid(beats, envelope, hop_seconds, 60.0 / (period * hop_seconds))
+    print(f"Analysed {song.name}: {grid.tempo:.0f} bpm, {len(beats)} beats in {time.time() - t0:.1f}s")
+    return grid
+
+#the song's grid, analysed once and then read back from the first cache path that is
+#newer than its stems; saved to the first path that can be written
+def get_grid(song, sources, paths):
+    newest = max(os.path.getmtime(path) for path in sources)
+    for path in paths:
+        if os.path.exists(path) and os.path.getmtime(path) >= newest:
+            grid = BeatGrid.load(path)
+            if grid is not None:
+                return grid
+    grid = analyze(song)
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            grid.save(path)
+            break
+        except OSError:
+            continue
+    return grid
+
+#usage: python3 beats.py [song ...]
+#analyses every song in SONGS_DIR that has no up to date grid yet
+if __name__ == "__main__":
+    import stems
+    loader = stems.StemLoader(stems.Library())
+    for name in sys.argv[1:] or loader.library.songs():
+        grid = loader.get(name).grid
+        if grid is not None:
+            print(f"{name}: {grid.tempo:.0f} bpm, {len(grid.beats)} beats")
@@ -1,42 +1,45 @@
 import random
 import speech_recognition as sr
-from gtts import gTTS
-import uuid
-import os
-import subprocess
+import speech
+from listener import get_listener
+import stt
+import kws
 from animations import set_expression
+from host import exec_menu
 
-recognizer = sr.Recognizer()
-mic = sr.Microphone(device_index=2)
+backend = stt.get_backend()
+listener = get_listener()
+spotter = None
+
+PHRASES = [
+    "I didn't hear anything.", "What was that, buddy?", "Later, buddy.",
+    "Alright buddy.", "Who asked, buddy?", "That ain't even a question, buddy.",
+]
 
 def speak(text):
     print("Buddy:", text)
     set_expression("happy")
-    tts = gTTS(text=text, lang='en', tld='co.uk')
-    filename = f"/tmp/{uuid.uuid4()}.mp3"
-    tts.save(filename)
-    os.system(f"mpg123 -q {filename}")
-    os.remove(filename)
+    with listener.mute():
+        speech.speak(text)
     set_expression("neutral")
 
 def listen():
-    with mic as source:
-        print("🎤 Listening...")
-        recognizer.energy_threshold = 250
-        recognizer.adjust_for_ambient_noise(source, duration=1)
-        try:
-            audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            print("Processing...")
-            return recognizer.recognize_google(audio)
-        except sr.WaitTimeoutError:
-            speak("I didn't hear anything.")
-            return None
-        except sr.UnknownValueError:
-            speak("What was that, buddy?")
-            return None
-        except sr.RequestError:
-            speak("Speech service is down, buddy.")
-            return None
+    print("🎤 Listening...")
+    try:
+        word, audio = kws.next_turn(listener, spotter, timeout=5)
+        if word:
+            return word
+        print("Processing...")
+        return stt.recognize(audio, backend)
+    except sr.WaitTimeoutError:
+        speak("I didn't hear anything.")
+        return None
+    except sr.UnknownValueError:
+        speak("What was that, buddy?")
+        return None
+    except sr.RequestError:
+        speak("Speech service is down, buddy.")
+        return None
 
 def is_question(text):
     question_words = ("who", "what", "when", "where", "why", "how")
@@ -44,9 +47,12 @@ def is_question(text):
 
 def launch_menu():
     speak("Opening the menu!")
-    subprocess.run(["python3", "/home/eyeay/app_menu.py"])
+    return "menu"
 
 def buddy_mode():
+    listener.decoder = (backend, None)
+    listener.flush()
+    speech.preload(PHRASES)
     set_expression("neutral")
     speak("Buddy mode activated. Ask me anything.")
 
@@ -62,8 +68,7 @@ def buddy_mode():
             break
 
         if "menu" in lower_input:
-            launch_menu()
-            break
+            return launch_menu()
 
         if is_question(lower_input):
             response = random.choice(["Alright buddy.", "Who asked, buddy?"])
@@ -72,5 +77,24 @@ def buddy_mode():
 
         speak(response)
 
+def start(host=None):
+    listener.resume()
+
+#the listener outlives the app in the host, stop capturing and decoding until the next start
+def stop(host=None):
+    listener.decoder = None
+    listener.pause()
+    speech.close()
+
+def main():
+    global spotter
+    spotter = kws.attach(listener, backend)
+    try:
+        return buddy_mode()
+    finally:
+        kws.detach(listener, spotter)
+        spotter = None
+
 if __name__ == "__main__":
-    buddy_mode()
+    if main() == "menu":
+        exec_menu()
@@ -0,0 +1,105 @@
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image, ImageDraw
+import hardware
+
+#ssd1306 addressing commands
+COLUMNADDR = 0x21
+PAGEADDR = 0x22
+#rough cost of opening an extra write window, in data bytes
+WINDOW_OVERHEAD = 8
+
+#keeps the last framebuffer and only pushes the pages/columns that changed
+class Display:
+    def __init__(self, device):
+        self.device = device
+        self.width = device.width
+        self.height = device.height
+        self.pages = self.height // 8
+        self.colstart = getattr(device, "_colstart", 0)
+        self.last = None
+        self.lock = threading.Lock()
+        self.pushes = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+
+    #1-bit image -> (pages, width) bytes, bit n of a byte is row page * 8 + n
+    def pack(self, image):
+        image = self.device.preprocess(image)
+        bits = np.asarray(image.convert("1"), dtype=bool)
+        return np.packbits(bits.reshape(self.pages, 8, self.width), axis=1, bitorder="little")[:, 0, :]
+
+    #dirty pages as (first page, last page, first col, last col) windows, neighbouring
+    #pages are merged when one wider window is cheaper than two separate ones
+    def _windows(self, buf):
+        if self.last is None:
+            return [(0, self.pages - 1, 0, self.width - 1)]
+        diff = buf != self.last
+        windows = []
+        for page in np.flatnonzero(diff.any(axis=1)):
+            cols = np.flatnonzero(diff[page])
+            c0, c1 = int(cols[0]), int(cols[-1])
+            if windows and windows[-1][1] == page - 1:
+                p0, p1, w0, w1 = windows[-1]
+                lo, hi = min(w0, c0), max(w1, c1)
+                merged = (page - p0 + 1) * (hi - lo + 1)
+                separate = (p1 - p0 + 1) * (w1 - w0 + 1) + (c1 - c0 + 1) + WINDOW_OVERHEAD
+                if merged <= separate:
+                    windows[-1] = (p0, int(page), lo, hi)
+                    continue
+            windows.append((int(page), int(page), c0, c1))
+        return windows
+
+    def blit(self, buf):
+        with self.lock:
+            windows = self._windows(buf)
+            if not windows:
+                self.skipped += 1
+                return
+            for p0, p1, c0, c1 in windows:
+                self.device.command(COLUMNADDR, self.colstart + c0, self.colstart + c1, PAGEADDR, p0, p1)
+                data = buf[p0:p1 + 1, c0:c1 + 1].ravel().tolist()
+                self.device.data(data)
+                self.bytes_sent += len(data)
+            self.pushes += 1
+            self.last = buf.copy()
+
+    #blits frames one after another, interval seconds apart
+    def play(self, frames, interval=0.0):
+        for i, buf in enumerate(frames):
+            if i and interval:
+                time.sleep(interval)
+            self.blit(buf)
+
+    def show(self, image):
+        self.blit(self.pack(image))
+
+    def clear(self):
+        self.blit(np.zeros((self.pages, self.width), np.uint8))
+
+    #forces the next frame out in full, e.g. after something else wrote to the panel
+    def invalidate(self):
+        with self.lock:
+            self.last = None
+
+    #drop-in for luma.core.render.canvas
+    @contextmanager
+    def canvas(self):
+        image = Image.new(self.device.mode, self.device.size)
+        yield ImageDraw.Draw(image)
+        self.show(image)
+
+    def stats(self):
+        return f"oled: {self.pushes} pushes, {self.skipped} skipped, {self.bytes_sent} bytes"
+
+_display = None
+_lock = threading.Lock()
+
+def get_display():
+    global _display
+    with _lock:
+        if _display is None:
+            _display = Display(hardware.get_device())
+        return _display
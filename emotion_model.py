@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+import cv2
+
+KERAS_MODEL = os.environ.get("EMOTION_MODEL", "/home/eyeay/Downloads/fer2013_mini_XCEPTION.102-0.66.hdf5")
+CACHE_DIR = os.path.expanduser("~/.cache/bevr")
+LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+SIZE = 64
+THREADS = 4
+MIN_CALIBRATION = 100  #recorded crops below this give shaky int8 ranges
+
+def tflite_path(keras_path=KERAS_MODEL):
+    name = os.path.splitext(os.path.basename(keras_path))[0]
+    return os.path.join(CACHE_DIR, name + ".int8.tflite")
+
+#gray 64x64 uint8 crops, one per (x1, y1, x2, y2) box, stacked so a frame is one batch
+def crops(rgb, boxes, out=None):
+    if out is None or len(out) < len(boxes):
+        out = np.empty((len(boxes), SIZE, SIZE), np.uint8)
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        gray = cv2.cvtColor(rgb[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+        cv2.resize(gray, (SIZE, SIZE), dst=out[i])
+    return out[:len(boxes)]
+
+#one-off conversion, the only place tensorflow is imported; full int8 quantization with
+#int8 in and out, calibrated on face crops recorded with --record so the activation
+#ranges come from real faces
+def convert(calibration, keras_path=KERAS_MODEL, out_path=None):
+    import tensorflow as tf
+    if calibration is None or len(calibration) == 0:
+        raise ValueError("int8 conversion needs recorded face crops, run --record first")
+    if len(calibration) < MIN_CALIBRATION:
+        print(f"WARNING: only {len(calibration)} calibration crops, record at least {MIN_CALIBRATION}")
+    out_path = out_path or tflite_path(keras_path)
+    model = tf.keras.models.load_model(keras_path, compile=False)
+
+    def representative():
+        for face in calibration:
+            yield [(face[None, :, :, None] / 255.0).astype(np.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    flat = converter.convert()
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(flat)
+    os.replace(tmp, out_path)
+    print(f"Converted {keras_path} -> {out_path} ({len(flat) // 1024} KB)")
+
+    expected = model.predict((calibration[..., None] / 255.0).astype(np.float32), verbose=0).argmax(1)
+    got = TFLiteClassifier(out_path, interpreter=tf.lite.Interpreter).predict(calibration).argmax(1)
+    print(f"int8 agrees with keras on {np.mean(expected == got):.3f} of {len(calibration)} calibration crops")
+    return out_path
+
+def _interpreter():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from ai_edge_litert.interpreter import Interpreter
+    return Interpreter
+
+#int8 model on the tflite runtime, every face in a frame goes through one invoke
+class TFLiteClassifier:
+    name = "tflite"
+
+    def __init__(self, path, threads=THREADS, interpreter=None):
+        self.interpreter = (interpreter or _interpreter())(model_path=path, num_threads=threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.in_scale, self.in_zero = self.input["quantization"]
+        self.out_scale, self.out_zero = self.output["quantization"]
+        self.batch = None
+
+    def _resize(self, n):
+        if n != self.batch:
+            self.interpreter.resize_tensor_input(self.input["index"], [n, SIZE, SIZE, 1])
+            self.interpreter.allocate_tensors()
+            self.batch = n
+
+    #faces: (n, 64, 64) uint8 gray -> (n, 7) probabilities
+    def predict(self, faces):
+        if len(faces) == 0:
+            return np.empty((0, len(LABELS)), np.float32)
+        self._resize(len(faces))
+        x = np.round(faces / (255.0 * self.in_scale) + self.in_zero)
+        x = np.clip(x, -128, 127).astype(np.int8)[..., None]
+        self.interpreter.set_tensor(self.input["index"], x)
+        self.interpreter.invoke()
+        y = self.interpreter.get_tensor(self.output["index"])
+        return (y.astype(np.float32) - self.out_zero) * self.out_scale
+
+#the original path, kept for the benchmark
+class KerasClassifier:
+    name = "keras"
+
+    def __init__(self, path=KERAS_MODEL):
+        from tensorflow.keras.models import load_model
+        self.model = load_model(path, compile=False)
+
+    #one predict call per face, like emotions.py used to do
+    def predict(self, faces):
+        if len(faces) == 0:
+            return np.empty((0, len(LABELS)), np.float32)
+        return np.concatenate([self.model.predict(face[None, :, :, None] / 255.0, verbose=0) for face in faces])
+
+_classifier = None
+_lock = threading.Lock()
+
+#the converted int8 model; converting needs recorded crops, so it never happens here
+def get_classifier(keras_path=KERAS_MODEL):
+    global _classifier
+    with _lock:
+        if _classifier is None:
+            path = tflite_path(keras_path)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No int8 emotion model at {path}, run: python3 emotion_model.py "
+                                        "--record crops.npz, then --convert crops.npz")
+            if os.path.exists(keras_path) and os.path.getmtime(keras_path) > os.path.getmtime(path):
+                print(f"WARNING: {keras_path} is newer than {path}, run --convert crops.npz again")
+            _classifier = TFLiteClassifier(path)
+        return _classifier
+
+#saves face crops from the live camera for calibration and benchmarking
+def record(path, frames=300):
+    import vision
+    reader = vision.open_reader(hands=False, faces=True)
+    faces, counts = [], []
+    try:
+        while len(counts) < frames:
+            frame = reader.read()
+            #frames committed before the face demand reached the service carry no detections
+            if frame is None or not frame.faces:
+                continue
+            h, w, _ = frame.image.shape
+            boxes = [(max(int(x * w), 0), max(int(y * h), 0), min(int((x + bw) * w), w), min(int((y + bh) * h), h))
+                     for x, y, bw, bh, score in frame.faces]
+            boxes = [b for b in boxes if b[2] > b[0] and b[3] > b[1]]
+            if boxes:
+                faces.extend(crops(frame.image, boxes))
+                counts.append(len(boxes))
+    finally:
+        reader.close()
+        vision.stop_service()
+    np.savez_compressed(path, faces=np.array(faces), counts=np.array(counts))
+    print(f"Saved {len(faces)} crops from {len(counts)} frames to {path}")
+
+#per-frame latency of both paths on recorded crops, and how often the int8 model agrees with keras
+def bench(path):
+    with np.load(path) as data:
+        faces, counts = data["faces"], data["counts"]
+        labels = data["labels"] if "labels" in data.files else None
+    batches = np.split(faces, np.cumsum(counts)[:-1])
+    results = {}
+    for clf in (KerasClassifier(), TFLiteClassifier(tflite_path())):
+        clf.predict(batches[0])
+        times, preds = [], []
+        for batch in batches:
+            t0 = time.perf_counter()
+            preds.append(clf.predict(batch))
+            times.append(time.perf_counter() - t0)
+        results[clf.name] = np.concatenate(preds).argmax(1)
+        times = np.array(times) * 1000
+        line = f"{clf.name:7s} {times.mean():6.2f} ms/frame (p95 {np.percentile(times, 95):.2f} ms)"
+        if labels is not None:
+            line += f", accuracy {np.mean(results[clf.name] == labels):.3f}"
+        print(line)
+    print(f"agreement {np.mean(results['keras'] == results['tflite']):.3f} over {len(faces)} crops in {len(batches)} frames")
+
+#usage: python3 emotion_model.py --record crops.npz [frames] | --convert crops.npz | --bench crops.npz
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--convert"] and len(sys.argv) > 2:
+        with np.load(sys.argv[2]) as data:
+            convert(data["faces"])
+    elif sys.argv[1:2] == ["--record"]:
+        record(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 300)
+    elif sys.argv[1:2] == ["--bench"]:
+        bench(sys.argv[2])
+    else:
+        print("usage: python3 emotion_model.py --record crops.npz [frames] | --convert crops.npz | --bench crops.npz")
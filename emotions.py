@@ -1,100 +1,120 @@
+import os
 import cv2
-import numpy as np
 import time
-import mediapipe as mp
-from picamera2 import Picamera2
-from tensorflow.keras.models import load_model
-from gtts import gTTS
-import os
+import hardware
+import emotion_model
+import facetrack
+import speech
+import vision
+import preview
+import frameprep
 from animations import set_expression
 
-model = load_model('/home/eyeay/Downloads/fer2013_mini_XCEPTION.102-0.66.hdf5', compile=False)
-emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-valid_emotions = ['happy', 'sad', 'fear']
-
-mp_face = mp.solutions.face_detection.FaceDetection(min_detection_confidence=0.6)
+classifier = emotion_model.get_classifier()
+emotion_labels = emotion_model.LABELS
+#track faces between sparse detections and classify each a few times a second,
+#EMOTION_TRACKING=0 detects and classifies every frame like before
+TRACKING = os.environ.get("EMOTION_TRACKING", "1") == "1"
 
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (640, 480)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.configure("preview")
-picam2.start()
+reader = vision.open_reader(hands=False, faces=True)
+prep = frameprep.FramePrep()
 
-current_state = None
-state_start_time = None
 mood_mode = "neutral"
-
-set_expression("neutral")
+tracker = None
 
 def speak(text):
-    tts = gTTS(text=text, lang='en', tld='co.uk')
-    tts.save("/tmp/emotion.mp3")
-    os.system("mpg123 /tmp/emotion.mp3")
-
-while True:
-    frame = picam2.capture_array()
-    rgb = cv2.cvtColor(cv2.flip(frame, 1), cv2.COLOR_BGR2RGB)
-    display_frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-
-    result = mp_face.process(rgb)
-    detected_emotion = None
-
-    if result.detections:
-        for detection in result.detections:
-            bbox = detection.location_data.relative_bounding_box
-            h, w, _ = rgb.shape
-            x1 = max(int(bbox.xmin * w), 0)
-            y1 = max(int(bbox.ymin * h), 0)
-            x2 = min(int((bbox.xmin + bbox.width) * w), w)
-            y2 = min(int((bbox.ymin + bbox.height) * h), h)
-
-            face = rgb[y1:y2, x1:x2]
+    speech.speak(text)
+
+def new_tracker():
+    if TRACKING:
+        return facetrack.FaceTracker()
+    return facetrack.FaceTracker(detect_every=1, classify_hz=float("inf"))
+
+def start(host=None):
+    global mood_mode, tracker
+    speech.preload(["Smile and cheer up!", "That's much better!", "You seem happy, keep it up"])
+    mood_mode = "neutral"
+    tracker = new_tracker()
+
+#the voice holds the audio device until it is closed
+def stop(host=None):
+    speech.close()
+
+def main():
+    global mood_mode
+
+    set_expression("neutral")
+
+    while True:
+        frame = reader.read(copy=False, detect_faces=tracker.needs_detection() if TRACKING else None)
+        if frame is None:
+            continue
+        rgb = frame.image
+        display_frame = prep.bgr(rgb) if preview.wanted() else None
+
+        h, w, _ = rgb.shape
+        detections = None if frame.faces is None else facetrack.boxes(frame.faces, w, h)
+        #the tracker keeps the previous gray frame, so two buffers take turns
+        tracker.update(prep.gray(rgb, keep=1), detections)
+
+        now = time.time()
+        due = tracker.due(now)
+        if due:
             try:
-                face_resized = cv2.resize(face, (64, 64))
-                gray_face = cv2.cvtColor(face_resized, cv2.COLOR_RGB2GRAY)
-
-                input_data = np.expand_dims(gray_face, axis=0)
-                input_data = np.expand_dims(input_data, axis=-1)
-                input_data = input_data / 255.0
-
-                predictions = model.predict(input_data, verbose=0)
-                raw_emotion = emotion_labels[np.argmax(predictions)]
-
-                if raw_emotion not in valid_emotions:
-                    continue
-
-                detected_emotion = "sad" if raw_emotion in ["sad", "fear"] else "happy"
-
-                cv2.rectangle(display_frame, (x1, y1), (x2, y2), (255, 255, 0), 2)
-                cv2.putText(display_frame, f"{detected_emotion}", (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-
+                #every face that is due in one call
+                faces = prep.buffer("faces", (vision.MAX_FACES, emotion_model.SIZE, emotion_model.SIZE))
+                predictions = classifier.predict(emotion_model.crops(rgb, [track.box for track in due], faces))
+                for track, probabilities in zip(due, predictions):
+                    track.add_scores(probabilities, now)
+                    if track.state is None:
+                        track.state = facetrack.EmotionState(emotion_labels)
+                    track.state.update(track.scores, now)
+                tracker.classifications += len(due)
             except Exception as e:
                 print("Face processing error:", e)
 
-    now = time.time()
-    if detected_emotion != current_state:
-        current_state = detected_emotion
-        state_start_time = now
-    elif detected_emotion and (now - state_start_time) >= 0.75:
-        if detected_emotion == "sad" and mood_mode == "neutral":
+        #each face has its own mood, the first one that newly settled gets a response;
+        #the others stay untaken and get theirs on a later frame
+        settled_emotion = None
+        for track in tracker.tracks:
+            if track.state is None or track.state.current is None:
+                continue
+            if settled_emotion is None:
+                settled_emotion = track.state.take(now)
+
+            if display_frame is None:
+                continue
+            x1, y1, x2, y2 = track.box
+            cv2.rectangle(display_frame, (x1, y1), (x2, y2), (255, 255, 0), 2)
+            cv2.putText(display_frame, f"{track.state.current}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+
+        if settled_emotion == "sad" and mood_mode == "neutral":
             speak("Smile and cheer up!")
             set_expression("happy")
             mood_mode = "prompted"
 
-        elif detected_emotion == "happy" and mood_mode == "prompted":
+        elif settled_emotion == "happy" and mood_mode == "prompted":
             speak("That's much better!")
             set_expression("neutral")
             mood_mode = "neutral"
 
-        elif detected_emotion == "happy" and mood_mode == "neutral":
+        elif settled_emotion == "happy" and mood_mode == "neutral":
             speak("You seem happy, keep it up")
             set_expression("happy")
             time.sleep(1)
             set_expression("neutral")
 
-    cv2.imshow("Emotion Response", display_frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        if display_frame is not None:
+            preview.show("Emotion Response", display_frame)
+        if preview.key() == ord('q'):
+            break
+
+    preview.close()
 
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    start()
+    main()
+    reader.close()
+    vision.stop_service()
+    hardware.close_all()
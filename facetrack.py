@@ -0,0 +1,175 @@
+import time
+import numpy as np
+import cv2
+
+DETECT_EVERY = 10  #frames between full detections while tracking holds
+MIN_CONFIDENCE = 0.6  #share of flow points that must survive, below it a detection is requested
+MATCH_IOU = 0.3
+MAX_POINTS = 30
+MIN_POINTS = 5
+MAX_FLOW_ERROR = 1.0  #forward-backward error in pixels for a point to count as tracked
+CLASSIFY_HZ = 4.0  #emotion classifications per second per face
+SMOOTHING = 0.4  #weight of a new classification in the running scores
+#a mood is entered above ENTER and only left again below EXIT, and counts once it held for DWELL seconds
+MOODS = {"happy": ["happy"], "sad": ["sad", "fear"]}
+ENTER = 0.5
+EXIT = 0.35
+DWELL = 0.75
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+#pixel (x1, y1, x2, y2) boxes from the detector's relative (xmin, ymin, width, height, score)
+def boxes(faces, width, height):
+    result = []
+    for xmin, ymin, w, h, score in faces:
+        x1, y1 = max(int(xmin * width), 0), max(int(ymin * height), 0)
+        x2, y2 = min(int((xmin + w) * width), width), min(int((ymin + h) * height), height)
+        if x2 > x1 and y2 > y1:
+            result.append(((x1, y1, x2, y2), score))
+    return result
+
+class Track:
+    def __init__(self, track_id, box, score):
+        self.id = track_id
+        self.box = box
+        self.score = score
+        self.confidence = 1.0
+        self.points = None
+        self.scores = None  #smoothed class probabilities
+        self.classified_at = 0.0
+        self.state = None
+
+    def seed(self, gray):
+        x1, y1, x2, y2 = self.box
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        self.points = cv2.goodFeaturesToTrack(gray, MAX_POINTS, 0.01, 5, mask=mask)
+
+    def add_scores(self, probabilities, now):
+        if self.scores is None:
+            self.scores = np.asarray(probabilities, np.float32).copy()
+        else:
+            self.scores += SMOOTHING * (probabilities - self.scores)
+        self.classified_at = now
+
+#per-face mood with hysteresis on the smoothed scores; take() reports a mood once
+#when it has settled, so flicker around a threshold can't trigger it again
+class EmotionState:
+    def __init__(self, labels, moods=MOODS, enter=ENTER, exit=EXIT, dwell=DWELL):
+        self.members = {mood: [labels.index(label) for label in names] for mood, names in moods.items()}
+        self.enter = enter
+        self.exit = exit
+        self.dwell = dwell
+        self.current = None
+        self.since = None
+        self.reported = None
+
+    def update(self, scores, now):
+        levels = {mood: float(np.sum(scores[idx])) for mood, idx in self.members.items()}
+        if self.current is not None and levels[self.current] < self.exit:
+            self.current = None
+            self.reported = None
+        if self.current is None:
+            mood = max(levels, key=levels.get)
+            if levels[mood] >= self.enter:
+                self.current = mood
+                self.since = now
+        return self.current
+
+    def settled(self, now):
+        return self.current is not None and now - self.since >= self.dwell
+
+    def take(self, now):
+        if self.settled(now) and self.reported != self.current:
+            self.reported = self.current
+            return self.current
+        return None
+
+#follows faces between detections with sparse optical flow, full detection is only
+#needed every few frames, when a face is lost or when the flow gets unreliable;
+#a lost track waits for the next detection so its face keeps its state if it is still there
+class FaceTracker:
+    def __init__(self, detect_every=DETECT_EVERY, classify_hz=CLASSIFY_HZ):
+        self.detect_every = detect_every
+        self.classify_interval = 1.0 / classify_hz
+        self.tracks = []
+        self.prev_gray = None
+        self.since_detection = detect_every
+        self.next_id = 1
+        self.frames = 0
+        self.detections = 0
+        self.classifications = 0
+
+    def needs_detection(self):
+        return (self.since_detection >= self.detect_every or not self.tracks
+                or any(t.confidence < MIN_CONFIDENCE for t in self.tracks))
+
+    #detections is None on frames the detector skipped
+    def update(self, gray, detections=None):
+        self.frames += 1
+        if detections is not None:
+            self._associate(gray, detections)
+            self.since_detection = 0
+            self.detections += 1
+        elif self.prev_gray is not None:
+            self._flow(gray)
+            self.since_detection += 1
+        self.prev_gray = gray
+        return self.tracks
+
+    def _associate(self, gray, detections):
+        unmatched = list(self.tracks)
+        tracks = []
+        for box, score in sorted(detections, key=lambda d: -d[1]):
+            best = max(unmatched, key=lambda t: iou(t.box, box), default=None)
+            if best is not None and iou(best.box, box) >= MATCH_IOU:
+                unmatched.remove(best)
+                track = best
+                track.box, track.score = box, score
+            else:
+                track = Track(self.next_id, box, score)
+                self.next_id += 1
+            track.confidence = 1.0
+            track.seed(gray)
+            tracks.append(track)
+        self.tracks = tracks
+
+    def _flow(self, gray):
+        h, w = gray.shape
+        for track in self.tracks:
+            if track.points is None or len(track.points) < MIN_POINTS:
+                track.confidence = 0.0
+                continue
+            new, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, track.points, None, **LK_PARAMS)
+            back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, new, None, **LK_PARAMS)
+            error = np.linalg.norm((track.points - back).reshape(-1, 2), axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < MAX_FLOW_ERROR)
+            track.confidence *= good.mean() if len(good) else 0.0
+            if good.sum() < MIN_POINTS:
+                track.confidence = 0.0
+                continue
+            shift = np.median((new - track.points).reshape(-1, 2)[good], axis=0)
+            dx, dy = int(round(shift[0])), int(round(shift[1]))
+            x1, y1, x2, y2 = track.box
+            bw, bh = x2 - x1, y2 - y1
+            x1 = min(max(x1 + dx, 0), w - bw)
+            y1 = min(max(y1 + dy, 0), h - bh)
+            track.box = (x1, y1, x1 + bw, y1 + bh)
+            track.points = new[good].reshape(-1, 1, 2)
+
+    #tracks whose emotion is older than the classification interval
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return [t for t in self.tracks if t.confidence > 0.0 and now - t.classified_at >= self.classify_interval]
+
+    def stats(self):
+        ratio = self.detections / self.frames if self.frames else 0.0
+        return f"faces: {len(self.tracks)} tracked, detector on {ratio:.0%} of frames, {self.classifications} classifications"
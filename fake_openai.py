@@ -0,0 +1,95 @@
+import sys
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#local stand-in for the chat completions endpoint, streams a canned reply word by word
+#usage: python3 fake_openai.py [--port 8765] [--delay 0.05], then run gpt.py with
+#OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake
+#python3 fake_openai.py --check streams one reply through llm.py and prints sentence timings
+REPLY = ("Hi there! I am a tiny robot and I love to chat. "
+         "Did you know that octopuses have three hearts? "
+         "That is a lot of love for one little sea creature!")
+
+class Handler(BaseHTTPRequestHandler):
+    reply = REPLY
+    delay = 0.05
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            self._json({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}, "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.delay)
+            self._event(model, {"content": word if i == 0 else " " + word}, None)
+        self._event(model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _event(self, model, delta, finish_reason):
+        chunk = {
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def _json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=8765, delay=0.05, reply=REPLY):
+    Handler.delay = delay
+    Handler.reply = reply
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+def check(port):
+    import threading
+    from openai import OpenAI
+    import llm
+
+    server = serve(port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="fake", base_url=f"http://127.0.0.1:{port}/v1")
+    t0 = time.time()
+    sentences = []
+    for sentence in llm.split_sentences(llm.stream_deltas(client, "fake", [{"role": "user", "content": "hi"}])):
+        sentences.append(sentence)
+        print(f"{(time.time() - t0) * 1000:6.0f} ms  {sentence}")
+    server.shutdown()
+    ok = " ".join(sentences) == REPLY and len(sentences) > 1
+    print("ok" if ok else "MISMATCH")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args.port) else 1)
+    print(f"Fake OpenAI endpoint on http://127.0.0.1:{args.port}/v1")
+    serve(args.port, args.delay).serve_forever()
@@ -1,65 +1,28 @@
-import cv2
-import mediapipe as mp
 import time
 import random
-import serial
-import os
-from picamera2 import Picamera2
-from animations import set_expression, move_servos, animate_neutral_to
-
-FRAME_WIDTH = 640
-FRAME_HEIGHT = 480
-
-ser = serial.Serial("/dev/ttyAMA0", 115200, timeout=1)
-time.sleep(2)
-
-camera = Picamera2()
-camera.configure(camera.create_still_configuration(main={"size": (FRAME_WIDTH, FRAME_HEIGHT)}))
-camera.start()
-
-mp_hands = mp.solutions.hands
-mp_drawing = mp.solutions.drawing_utils
-hands_detector = mp_hands.Hands(
-    min_detection_confidence=0.7,
-    min_tracking_confidence=0.7,
-    max_num_hands=1
-)
-
-def is_finger_extended(landmarks, tip_id, pip_id):
-    return landmarks[tip_id].y < landmarks[pip_id].y
-
-def is_gun_gesture(landmarks):
-    index = is_finger_extended(landmarks, 8, 6)
-    middle = is_finger_extended(landmarks, 12, 10)
-    ring = not is_finger_extended(landmarks, 16, 14)
-    pinky = not is_finger_extended(landmarks, 20, 18)
-    thumb = landmarks[4].y < landmarks[0].y - 0.05
-    return index and middle and ring and pinky and thumb
-
-def is_fist(landmarks):
-    fingers = [
-        not is_finger_extended(landmarks, 8, 6),
-        not is_finger_extended(landmarks, 12, 10),
-        not is_finger_extended(landmarks, 16, 14),
-        not is_finger_extended(landmarks, 20, 18),
-    ]
-    thumb_bent = landmarks[4].x < landmarks[3].x
-    return all(fingers) and thumb_bent
+import hardware
+import vision
+import preview
+import frameprep
+import gesture
+import scheduler
+from host import exec_menu
+from animations import set_expression, move_servos, animate_neutral_to, eye_keyframes, transition_time, timelines
+
+FRAME_WIDTH = hardware.FRAME_WIDTH
+FRAME_HEIGHT = hardware.FRAME_HEIGHT
+
+reader = vision.open_reader(hands=True)
+prep = frameprep.FramePrep()
+gestures = gesture.get_classifier()
 
 def blink_once():
-    animate_neutral_to("neutral")
-    time.sleep(0.1)
-    animate_neutral_to("neutral")
+    timelines.play("eyes", eye_keyframes("neutral") + eye_keyframes("neutral", start=transition_time() + 0.1))
     print("blink")
 
 def shake_head(pan_min=80, pan_max=100, duration=2.0, speed=0.1):
-    end_time = time.time() + duration
-    toggle = False
-    while time.time() < end_time:
-        pan = pan_min if toggle else pan_max
-        toggle = not toggle
-        move_servos(pan, 75, 65, 115)
-        time.sleep(speed)
+    poses = [(pan_min if i % 2 else pan_max, 75, 65, 115) for i in range(int(duration / speed))]
+    return timelines.play("servos", scheduler.frames(poses, speed, lambda pose: move_servos(*pose)))
 
 def main():
     gesture_triggered = False
@@ -67,36 +30,42 @@ def main():
     next_blink_interval = random.uniform(3, 7)
     reset_time = None
 
+    def on_gun(event):
+        nonlocal gesture_triggered, reset_time
+        if not gesture_triggered:
+            print("Gun gesture detected!")
+            move_servos(90, 75, 65, 115)
+            animate_neutral_to("confused")
+            shake_head()
+            reset_time = time.time() + 3
+            gesture_triggered = True
+
+    def on_fist(event):
+        print("Fist detected! Exiting to menu...")
+        return "menu"
+
+    events = gesture.GestureEvents()
+    events.on("tap", "gun", on_gun)
+    events.on("tap", "fist", on_fist)
+
     set_expression("neutral")
 
     while True:
-        frame = camera.capture_array("main")
-        frame = cv2.flip(frame, 1)
-        display_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-        results = hands_detector.process(frame)
+        frame = reader.read(copy=False)
+        if frame is None:
+            continue
+        display_frame = prep.bgr(frame.image) if preview.wanted() else None
         current_time = time.time()
 
-        if results.multi_hand_landmarks:
-            for hand_landmarks in results.multi_hand_landmarks:
-                mp_drawing.draw_landmarks(display_frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-                lm = hand_landmarks.landmark
-
-                if is_gun_gesture(lm) and not gesture_triggered:
-                    print("Gun gesture detected!")
-                    move_servos(90, 75, 65, 115)
-                    animate_neutral_to("confused")
-                    shake_head()
-                    reset_time = time.time() + 3
-                    gesture_triggered = True
-
-                elif is_fist(lm):
-                    print("Fist detected! Exiting to menu...")
-                    camera.stop()
-                    time.sleep(1.0)
-                    cv2.destroyAllWindows()
-                    ser.close()
-                    os.execvp("python3", ["python3", "/home/eyeay/app_menu.py"])
+        #a fist on any hand wins, then a gun
+        labels = []
+        for hand in frame.hands or []:
+            if display_frame is not None:
+                vision.draw_hand(display_frame, hand)
+            labels.append(gestures.classify(hand))
+        label = next((name for name in ("fist", "gun") if name in labels), None)
+        if "menu" in events.update(label, current_time):
+            return "menu"
 
         if gesture_triggered and reset_time and current_time > reset_time:
             set_expression("neutral")
@@ -111,17 +80,21 @@ def main():
             last_blink_time = current_time
             next_blink_interval = random.uniform(3, 7)
 
-        cv2.imshow("Robot - Gun Gesture Response", display_frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if display_frame is not None:
+            preview.show("Robot - Gun Gesture Response", display_frame)
+        if preview.key() == ord('q'):
             break
 
         time.sleep(0.01)
 
-    camera.stop()
-    time.sleep(0.5)
-    cv2.destroyAllWindows()
-    ser.close()
-    os.execvp("python3", ["python3", "/home/eyeay/app_menu.py"])
+    return "menu"
+
+def stop(host=None):
+    timelines.cancel()
+    preview.close()
 
 if __name__ == "__main__":
     main()
+    stop()
+    vision.stop_service()
+    exec_menu()
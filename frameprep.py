@@ -0,0 +1,64 @@
+import os
+import tracemalloc
+import numpy as np
+import cv2
+
+#BEVR_ALLOC=1 traces python/numpy allocations and reports the bytes allocated per frame
+TRACE_ALLOCATIONS = os.environ.get("BEVR_ALLOC", "0") == "1"
+REPORT_EVERY = 100  #frames
+
+#conversions of the shared frame into buffers that are allocated once and reused,
+#so the per-frame loops stop producing full-frame garbage
+class FramePrep:
+    def __init__(self):
+        self.buffers = {}
+        self.turn = {}
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self.buffers[name] = np.empty(shape, dtype)
+        return buf
+
+    def convert(self, image, code, name, channels=3):
+        shape = image.shape[:2] + ((channels,) if channels > 1 else ())
+        return cv2.cvtColor(image, code, dst=self.buffer(name, shape))
+
+    #bgr copy to draw the debug view on, overwritten by the next call
+    def bgr(self, image):
+        return self.convert(image, cv2.COLOR_RGB2BGR, "bgr")
+
+    #gray frame that stays valid for `keep` more calls, for trackers holding the previous one
+    def gray(self, image, keep=1):
+        turn = self.turn.get("gray", 0)
+        self.turn["gray"] = (turn + 1) % (keep + 1)
+        return self.convert(image, cv2.COLOR_RGB2GRAY, f"gray{turn}", channels=1)
+
+#bytes allocated and released again within each frame, from tracemalloc's peak over the frame
+class AllocationMeter:
+    def __init__(self, report_every=REPORT_EVERY):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.report_every = report_every
+        self.frames = 0
+        self.window = 0
+        self.total = 0
+        self.start = tracemalloc.get_traced_memory()[0]
+
+    def tick(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.total += max(peak - self.start, 0)
+        self.frames += 1
+        self.window += 1
+        tracemalloc.reset_peak()
+        self.start = current
+        if self.window >= self.report_every:
+            print(self.stats())
+            self.total = 0
+            self.window = 0
+
+    def stats(self):
+        return f"alloc: {self.total / max(self.window, 1) / 1024:.0f} KB/frame over {self.window} frames"
+
+def meter():
+    return AllocationMeter() if TRACE_ALLOCATIONS else None
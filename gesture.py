@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import threading
+from collections import namedtuple
+import numpy as np
+
+TIPS = [8, 12, 16, 20]
+PIPS = [6, 10, 14, 18]
+FEATURES = ["index", "middle", "ring", "pinky", "pinch", "thumb_x", "thumb_up"]
+GESTURES = ["none", "fist", "pinch", "gun", "open"]
+EXTENSION_FACTOR = 0.35  #finger extension, as a share of hand height, that counts as full volume
+MODEL_PATH = os.environ.get("GESTURE_MODEL", os.path.expanduser("~/.cache/bevr/gestures.npz"))
+ON_FRAMES = 2  #frames a gesture must be seen before it counts as pressed
+OFF_FRAMES = 3  #frames it must be gone before it counts as released
+DOUBLE_TAP = 1.5
+HELD_TIMEOUT = 0.5  #a label seen this recently by any GestureEvents is still held at a new one's start
+#generated by synthesize() around the rule thresholds, so it only smoke-tests the code
+#paths: the rules score 1.0 on it by construction
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gesture_synthetic.json")
+#real mediapipe hands made with --record-all, what --check/--train/--bench use when it is there
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gesture_recorded.json")
+
+#one row per hand from (21, 3) landmark arrays, or a stack of them, in a single pass:
+#finger extension (pip above tip, over hand height), thumb-index distance, thumb side and height
+def features(hands):
+    lm = np.asarray(hands, np.float32)
+    if lm.ndim == 2:
+        return np.array(hand_features(lm.tolist()), np.float32)
+    lm = lm.reshape(-1, 21, 3)
+    y = lm[:, :, 1]
+    height = np.maximum(y.max(axis=1) - y.min(axis=1), 1e-6)
+    out = np.empty((len(lm), len(FEATURES)), np.float32)
+    out[:, :4] = (y[:, PIPS] - y[:, TIPS]) / height[:, None]
+    out[:, 4] = np.hypot(lm[:, 4, 0] - lm[:, 8, 0], lm[:, 4, 1] - lm[:, 8, 1])
+    out[:, 5] = lm[:, 3, 0] - lm[:, 4, 0]
+    out[:, 6] = lm[:, 0, 1] - lm[:, 4, 1]
+    return out
+
+#the same row for one hand in plain python, which beats a dozen small numpy calls per frame
+def hand_features(lm):
+    ys = [p[1] for p in lm]
+    height = max(max(ys) - min(ys), 1e-6)
+    row = [(ys[pip] - ys[tip]) / height for pip, tip in zip(PIPS, TIPS)]
+    row.append(math.hypot(lm[4][0] - lm[8][0], lm[4][1] - lm[8][1]))
+    row.append(lm[3][0] - lm[4][0])
+    row.append(lm[0][1] - lm[4][1])
+    return row
+
+#index, middle, ring, pinky extension as 0-1 levels
+def volumes(feats, factor=EXTENSION_FACTOR):
+    return np.clip(np.asarray(feats)[..., :4] / factor, 0.0, 1.0)
+
+#hand-tuned thresholds, checked in order so a fist wins over a pinch
+class RuleClassifier:
+    def __init__(self, pinch=0.05, curl=0.0, extend=0.0, thumb_up=0.05):
+        self.pinch = pinch
+        self.curl = curl
+        self.extend = extend
+        self.thumb_up = thumb_up
+
+    def predict(self, feats):
+        f = np.asarray(feats)
+        if f.ndim == 1:
+            return np.array([self.rule(f.tolist())])
+        ext = f[:, :4]
+        curled = ext < self.curl
+        extended = ext > self.extend
+        conditions = [
+            curled.all(axis=1) & (f[:, 5] > 0),
+            f[:, 4] < self.pinch,
+            extended[:, 0] & extended[:, 1] & curled[:, 2] & curled[:, 3] & (f[:, 6] > self.thumb_up),
+            extended.all(axis=1),
+        ]
+        return np.select(conditions, [1, 2, 3, 4], 0)
+
+    #predict() for one row of plain floats
+    def rule(self, f):
+        curled = [e < self.curl for e in f[:4]]
+        extended = [e > self.extend for e in f[:4]]
+        if all(curled) and f[5] > 0:
+            return 1
+        if f[4] < self.pinch:
+            return 2
+        if extended[0] and extended[1] and curled[2] and curled[3] and f[6] > self.thumb_up:
+            return 3
+        if all(extended):
+            return 4
+        return 0
+
+    def classify(self, hand):
+        return label(features(hand), self)
+
+#nearest centroid on standardized features, trained from labelled landmarks
+class CentroidClassifier:
+    def __init__(self, centroids, mean, scale):
+        self.centroids = centroids
+        self.mean = mean
+        self.scale = scale
+
+    @classmethod
+    def train(cls, feats, labels):
+        feats = np.asarray(feats, np.float32)
+        labels = np.asarray(labels)
+        mean = feats.mean(axis=0)
+        scale = feats.std(axis=0) + 1e-6
+        centroids = np.full((len(GESTURES), feats.shape[1]), np.inf, np.float32)
+        for i in range(len(GESTURES)):
+            if np.any(labels == i):
+                centroids[i] = ((feats[labels == i] - mean) / scale).mean(axis=0)
+        return cls(centroids, mean, scale)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["mean"], data["scale"])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, centroids=self.centroids, mean=self.mean, scale=self.scale)
+
+    def predict(self, feats):
+        z = (np.atleast_2d(feats) - self.mean) / self.scale
+        return np.argmin(((z[:, None, :] - self.centroids[None]) ** 2).sum(axis=2), axis=1)
+
+    def classify(self, hand):
+        return label(features(hand), self)
+
+_classifier = None
+_lock = threading.Lock()
+
+#the trained model when one has been saved, the rules otherwise
+def get_classifier(path=MODEL_PATH):
+    global _classifier
+    with _lock:
+        if _classifier is None:
+            if os.path.exists(path):
+                _classifier = CentroidClassifier.load(path)
+                print("Gestures: trained model from", path)
+            else:
+                _classifier = RuleClassifier()
+        return _classifier
+
+#gesture name for one hand's features
+def label(feats, classifier=None):
+    return GESTURES[int((classifier or get_classifier()).predict(feats)[0])]
+
+#kind is tap, double_tap, hold or release; duration is how long the gesture was held
+#(for a hold, the hold time it was subscribed with)
+Event = namedtuple("Event", "kind gesture time duration")
+
+#last label any GestureEvents was fed and when, so the gesture that launched an app
+#isn't pressed again the moment the app starts listening
+_held = [None, 0.0]
+
+#turns per-frame labels into debounced events and calls whoever subscribed to them;
+#only one gesture is active at a time, a new one has to wait for the old one's release.
+#a tap is reported on press, unless it completes a double tap someone is listening for;
+#a gesture already held when the events are created only counts after it is released
+class GestureEvents:
+    def __init__(self, on_frames=ON_FRAMES, off_frames=OFF_FRAMES, double_tap=DOUBLE_TAP, cooldown=0.0):
+        self.on_frames = on_frames
+        self.off_frames = off_frames
+        self.double_tap = double_tap
+        self.cooldown = cooldown  #minimum time between taps of any gesture
+        self.handlers = []
+        self.reset()
+
+    def reset(self):
+        self.active = None
+        self.since = None
+        self.candidate = None
+        self.seen = 0
+        self.missed = 0
+        self.held = set()
+        self.last_tap = {}
+        self.last_fired = -self.cooldown
+        label, seen = _held
+        self.blocked = label if time.time() - seen < HELD_TIMEOUT else None
+        self.blocked_missed = 0
+
+    #callback(event) runs for matching events, hold needs seconds
+    def on(self, kind, gesture, callback, seconds=None):
+        self.handlers.append((kind, gesture, seconds, callback))
+        return callback
+
+    #label for this frame (None or "none" when there is no gesture), returns what the callbacks returned
+    def update(self, label, now=None):
+        now = time.time() if now is None else now
+        label = None if label == "none" else label
+        _held[:] = [label, now]
+        if self.blocked is not None:
+            if label == self.blocked:
+                self.blocked_missed = 0
+                label = None
+            else:
+                self.blocked_missed += 1
+                if self.blocked_missed >= self.off_frames:
+                    self.blocked = None
+        events = []
+        if label == self.active:
+            self.missed = 0
+            self.candidate, self.seen = None, 0
+        else:
+            if self.active is not None:
+                self.missed += 1
+                if self.missed >= self.off_frames:
+                    events.append(Event("release", self.active, now, now - self.since))
+                    self.active = None
+            if label is None:
+                self.candidate, self.seen = None, 0
+            else:
+                self.seen = self.seen + 1 if label == self.candidate else 1
+                self.candidate = label
+                if self.active is None and self.seen >= self.on_frames:
+                    self.active, self.since = label, now
+                    self.candidate, self.seen, self.missed = None, 0, 0
+                    self.held = set()
+                    events.append(self._tap(label, now))
+
+        if self.active is not None:
+            for kind, gesture, seconds, _ in self.handlers:
+                if kind == "hold" and gesture == self.active and seconds not in self.held and now - self.since >= seconds:
+                    self.held.add(seconds)
+                    events.append(Event("hold", gesture, now, seconds))
+        return self._dispatch(events)
+
+    def _tap(self, gesture, now):
+        if now - self.last_fired < self.cooldown:
+            return None
+        self.last_fired = now
+        listening = any(kind == "double_tap" and g == gesture for kind, g, _, _ in self.handlers)
+        last = self.last_tap.pop(gesture, None)
+        if listening and last is not None and now - last < self.double_tap:
+            return Event("double_tap", gesture, now, 0.0)
+        self.last_tap[gesture] = now
+        return Event("tap", gesture, now, 0.0)
+
+    def _dispatch(self, events):
+        results = []
+        for event in events:
+            if event is None:
+                continue
+            for kind, gesture, seconds, callback in self.handlers:
+                if kind == event.kind and gesture == event.gesture and (kind != "hold" or seconds == event.duration):
+                    result = callback(event)
+                    if result is not None:
+                        results.append(result)
+        return results
+
+#labelled landmark sets are json: [{"label": "fist", "landmarks": [[x, y, z] * 21]}, ...]
+def load_fixtures(path=FIXTURES):
+    with open(path) as f:
+        items = json.load(f)
+    hands = np.array([item["landmarks"] for item in items], np.float32)
+    labels = np.array([GESTURES.index(item["label"]) for item in items])
+    return hands, labels
+
+def save_fixtures(items, path):
+    with open(path, "w") as f:
+        json.dump(items, f)
+
+#one labelled pose, pure python so the fixture file can be made anywhere
+def synthetic(label, rng=random):
+    fingers = {
+        "fist": (False, False, False, False), "pinch": (None, True, True, True),
+        "gun": (True, True, False, False), "open": (True, True, True, True),
+        "none": (True, False, False, False),
+    }[label]
+    wrist = (0.5, 0.8)
+    points = [wrist, (0.44, 0.74), (0.40, 0.68)]
+    if label == "fist":
+        points += [(0.44, 0.63), (0.42, 0.62)]
+    elif label == "pinch":
+        points += [(0.37, 0.60), (0.39, 0.53)]
+    else:
+        points += [(0.35, 0.63), (0.32, 0.58)]
+    for i, extended in enumerate(fingers):
+        x = 0.43 + 0.06 * i
+        base = 0.6 + 0.01 * abs(i - 1.5)
+        if extended:
+            joints = [(x, base), (x, base - 0.06), (x, base - 0.105), (x, base - 0.14)]
+        elif extended is None:
+            joints = [(x, base), (x - 0.02, base - 0.05), (x - 0.035, base - 0.065), (0.40, 0.54)]
+        else:
+            joints = [(x, base), (x, base - 0.05), (x + 0.01, base - 0.03), (x + 0.01, base + 0.01)]
+        points += joints
+    scale = rng.uniform(0.8, 1.2)
+    dx, dy = rng.uniform(-0.1, 0.1), rng.uniform(-0.1, 0.1)
+    noise = lambda: rng.gauss(0, 0.003)
+    return [[round(wrist[0] + (px - wrist[0]) * scale + dx + noise(), 4),
+             round(wrist[1] + (py - wrist[1]) * scale + dy + noise(), 4),
+             round(noise(), 4)] for px, py in points]
+
+def synthesize(per_label=40, seed=0):
+    rng = random.Random(seed)
+    return [{"label": label, "landmarks": synthetic(label, rng)} for label in GESTURES for _ in range(per_label)]
+
+#saves hands from the camera as one label, hold the pose while it records
+def record(label, path, count=100):
+    import vision
+    reader = vision.open_reader(hands=True)
+    items = []
+    if os.path.exists(path):
+        with open(path) as f:
+            items = json.load(f)
+    taken = 0
+    try:
+        while taken < count:
+            frame = reader.read()
+            if frame is None or not frame.hands:
+                continue
+            items.append({"label": label, "landmarks": np.round(frame.hands[0], 4).tolist()})
+            taken += 1
+    finally:
+        reader.close()
+        vision.stop_service()
+    save_fixtures(items, path)
+    print(f"Recorded {taken} '{label}' hands into {path} ({len(items)} total)")
+
+#every gesture in turn into one file, a few seconds to get the pose ready before each
+def record_all(path=RECORDED, count=100, ready=3.0):
+    for label in GESTURES:
+        input(f"Hold '{label}' in front of the camera and press enter")
+        time.sleep(ready)
+        record(label, path, count)
+
+def default_fixtures():
+    return RECORDED if os.path.exists(RECORDED) else FIXTURES
+
+def check(classifier, path=FIXTURES):
+    hands, labels = load_fixtures(path)
+    predicted = classifier.predict(features(hands))
+    print(f"{type(classifier).__name__}: {np.mean(predicted == labels):.3f} accuracy on {len(labels)} hands")
+    if os.path.abspath(path) == FIXTURES:
+        print("  (synthetic smoke set built around the rules, make gesture_recorded.json with --record-all to measure accuracy)")
+    for i, name in enumerate(GESTURES):
+        mask = labels == i
+        if mask.any():
+            print(f"  {name:6s} {np.mean(predicted[mask] == i):.3f} ({mask.sum()})")
+    return predicted, labels
+
+#hands per second: the old per-app landmark walk vs one vectorized pass per frame and per batch
+def bench(path=FIXTURES, rounds=20):
+    from vision import points
+    hands, _ = load_fixtures(path)
+    classifier = RuleClassifier()
+
+    def legacy(lm):
+        fist = all(lm[tip].y > lm[pip].y for tip, pip in zip(TIPS, PIPS)) and lm[4].x < lm[3].x
+        pinch = math.hypot(lm[4].x - lm[8].x, lm[4].y - lm[8].y) < 0.05
+        ys = [l.y for l in lm]
+        height = max(ys) - min(ys) or 1
+        levels = [max(0.0, min(1.0, (lm[pip].y - lm[tip].y) / (height * EXTENSION_FACTOR))) for pip, tip in zip(PIPS, TIPS)]
+        return fist, pinch, levels
+
+    def per_frame(hand):
+        feats = features(hand)
+        return classifier.predict(feats), volumes(feats)
+
+    def batch(stack):
+        feats = features(stack)
+        return classifier.predict(feats), volumes(feats)
+
+    runs = [
+        ("legacy", lambda: [legacy(points(hand)) for hand in hands]),
+        ("per frame", lambda: [per_frame(hand) for hand in hands]),
+        ("batch", lambda: batch(hands)),
+    ]
+    for label, fn in runs:
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        elapsed = time.perf_counter() - t0
+        print(f"{label:9s} {rounds * len(hands) / elapsed:10.0f} hands/s")
+
+#usage: python3 gesture.py --synth [path] | --record label path [count] | --record-all [path] [count]
+#                          | --train [path] | --check [path] | --bench [path]
+#without a path --train/--check/--bench use gesture_recorded.json, or the synthetic set until one is recorded
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--synth"]:
+        save_fixtures(synthesize(), args[1] if len(args) > 1 else FIXTURES)
+    elif args[:1] == ["--record"]:
+        record(args[1], args[2], int(args[3]) if len(args) > 3 else 100)
+    elif args[:1] == ["--record-all"]:
+        record_all(args[1] if len(args) > 1 else RECORDED, int(args[2]) if len(args) > 2 else 100)
+    elif args[:1] == ["--train"]:
+        path = args[1] if len(args) > 1 else default_fixtures()
+        hands, labels = load_fixtures(path)
+        model = CentroidClassifier.train(features(hands), labels)
+        model.save(MODEL_PATH)
+        print("Saved", MODEL_PATH)
+        check(model, path)
+    elif args[:1] == ["--check"]:
+        path = args[1] if len(args) > 1 else default_fixtures()
+        check(RuleClassifier(), path)
+        if os.path.exists(MODEL_PATH):
+            check(CentroidClassifier.load(MODEL_PATH), path)
+    elif args[:1] == ["--bench"]:
+        bench(args[1] if len(args) > 1 else default_fixtures())
+    else:
+        print("usage: python3 gesture.py --synth [path] | --record label path [count] | --record-all [path] [count] "
+              "| --train [path] | --check [path] | --bench [path]")
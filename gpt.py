@@ -1,65 +1,112 @@
 import os
 import speech_recognition as sr
 from openai import OpenAI
-from gtts import gTTS
-from playsound import playsound
-import uuid
-import subprocess
+import speech
+from listener import get_listener
+import stt
+import kws
+import llm
 from animations import set_expression
+from host import exec_menu
 
 MODEL = "gpt-4o"
+#speak each sentence while the rest of the reply is still generating, GPT_STREAM=0 waits for the full reply
+STREAMING = os.environ.get("GPT_STREAM", "1") != "0"
+SESSION_PATH = os.path.expanduser("~/.cache/bevr/gpt_session.json")
 client = OpenAI(api_key="API KEY GOES HERE")
-recognizer = sr.Recognizer()
-mic = sr.Microphone(device_index=2)
+backend = stt.get_backend()
+listener = get_listener()
+spotter = None
 
-conversation = [
-    {"role": "system", "content": "You are a helpful and friendly assistant built into a small robot. You sound like a child and keep responses short and cheerful. Do not use emojis in your answers"}
-]
+SYSTEM_PROMPT = "You are a helpful and friendly assistant built into a small robot. You sound like a child and keep responses short and cheerful. Do not use emojis in your answers"
+conversation = llm.Conversation(SYSTEM_PROMPT, summarize=llm.make_summarizer(client, MODEL))
 
 def speak(text):
     print("Robot:", text)
     set_expression("happy")
-    tts = gTTS(text=text, lang='en', tld='co.uk')
-    filename = f"/tmp/{uuid.uuid4()}.mp3"
-    tts.save(filename)
-    playsound(filename)
-    os.remove(filename)
+    with listener.mute():
+        speech.speak(text)
     set_expression("neutral")
 
 def listen():
-    with mic as source:
-        print("Listening...")
-        recognizer.energy_threshold = 250
-        recognizer.adjust_for_ambient_noise(source, duration=1)
-        try:
-            audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            print("Processing...")
-            return recognizer.recognize_google(audio)
-        except sr.WaitTimeoutError:
-            speak("I didn't hear anything.")
-            return None
-        except sr.UnknownValueError:
-            speak("Sorry, I couldn't understand that.")
-            return None
-        except sr.RequestError:
-            speak("Speech service is down.")
-            return None
+    print("Listening...")
+    try:
+        word, audio = kws.next_turn(listener, spotter, timeout=5)
+        if word:
+            return word
+        print("Processing...")
+        return stt.recognize(audio, backend)
+    except sr.WaitTimeoutError:
+        speak("I didn't hear anything.")
+        return None
+    except sr.UnknownValueError:
+        speak("Sorry, I couldn't understand that.")
+        return None
+    except sr.RequestError:
+        speak("Speech service is down.")
+        return None
+
+def finish_turn(reply):
+    conversation.add("assistant", reply)
+    conversation.save(SESSION_PATH)
+    conversation.compact_async()
 
 def chat_with_gpt(prompt):
-    conversation.append({"role": "user", "content": prompt})
+    conversation.add("user", prompt)
     response = client.chat.completions.create(
         model=MODEL,
-        messages=conversation
+        messages=conversation.messages()
     )
     reply = response.choices[0].message.content
-    conversation.append({"role": "assistant", "content": reply})
+    finish_turn(reply)
     return reply
 
+def chat_with_gpt_stream(prompt):
+    conversation.add("user", prompt)
+    sentences = []
+    for sentence in llm.split_sentences(llm.stream_deltas(client, MODEL, conversation.messages())):
+        sentences.append(sentence)
+        yield sentence
+    finish_turn(" ".join(sentences))
+
+def speak_stream(sentences):
+    set_expression("happy")
+    with listener.mute():
+        speech.speak_stream(sentences, on_text=lambda text: print("Robot:", text))
+    set_expression("neutral")
+
 def launch_menu():
     speak("Opening the menu!")
-    subprocess.run(["python3", "/home/eyeay/app_menu.py"])
+    return "menu"
 
-if __name__ == "__main__":
+def start(host=None):
+    listener.resume()
+
+#the listener outlives the app in the host, stop capturing and decoding until the next start
+def stop(host=None):
+    listener.decoder = None
+    listener.pause()
+    speech.close()
+
+def main():
+    global spotter
+    spotter = kws.attach(listener, backend)
+    try:
+        return converse()
+    finally:
+        kws.detach(listener, spotter)
+        spotter = None
+
+def converse():
+    listener.decoder = (backend, None)
+    listener.flush()
+    if os.path.exists(SESSION_PATH):
+        try:
+            conversation.load(SESSION_PATH)
+            print(f"Resumed chat, {conversation.tokens()} tokens of context")
+        except (OSError, ValueError) as e:
+            print("Could not load saved chat:", e)
+    speech.preload(["I didn't hear anything.", "Sorry, I couldn't understand that.", "Goodbye! See you later!"])
     set_expression("neutral")
     speak("Hello! I'm ready to chat.")
 
@@ -75,8 +122,14 @@ if __name__ == "__main__":
             break
 
         if "menu" in user_input_lower:
-            launch_menu()
-            break
+            return launch_menu()
+
+        if STREAMING:
+            speak_stream(chat_with_gpt_stream(user_input))
+        else:
+            response = chat_with_gpt(user_input)
+            speak(response)
 
-        response = chat_with_gpt(user_input)
-        speak(response)
+if __name__ == "__main__":
+    if main() == "menu":
+        exec_menu()
@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+#second, low-res yuv stream from the camera for detectors that don't need the full frame
+LORES = os.environ.get("BEVR_LORES", "1") == "1"
+LORES_WIDTH = 320
+LORES_HEIGHT = 240
+#the camera mirrors the image itself, so frames need no flip on the cpu
+MIRRORED = os.environ.get("BEVR_CAMERA_HFLIP", "1") == "1"
+SERIAL_PORT = "/dev/ttyAMA0"
+SERIAL_BAUD = 115200
+OLED_PORT = 1
+OLED_ADDRESS = 0x3D
+
+#shared devices, opened once per process and reused by every app
+_lock = threading.RLock()
+_camera = None
+_hands = None
+_faces = None
+_device = None
+_ser = None
+
+def get_camera():
+    global _camera
+    with _lock:
+        if _camera is None:
+            from picamera2 import Picamera2
+            _camera = Picamera2()
+            #BGR888 is packed 3-byte pixels in r, g, b order, what the frame bus stores
+            streams = {"main": {"size": (FRAME_WIDTH, FRAME_HEIGHT), "format": "BGR888"}}
+            if LORES:
+                streams["lores"] = {"size": (LORES_WIDTH, LORES_HEIGHT), "format": "YUV420"}
+            if MIRRORED:
+                from libcamera import Transform
+                streams["transform"] = Transform(hflip=1)
+            _camera.configure(_camera.create_still_configuration(**streams))
+            _camera.start()
+        return _camera
+
+def get_hands():
+    global _hands
+    with _lock:
+        if _hands is None:
+            import mediapipe as mp
+            _hands = mp.solutions.hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7, max_num_hands=1)
+        return _hands
+
+def get_face_detector():
+    global _faces
+    with _lock:
+        if _faces is None:
+            import mediapipe as mp
+            _faces = mp.solutions.face_detection.FaceDetection(min_detection_confidence=0.6)
+        return _faces
+
+def get_device():
+    global _device
+    with _lock:
+        if _device is None:
+            from luma.core.interface.serial import i2c
+            from luma.oled.device import ssd1306
+            _device = ssd1306(i2c(port=OLED_PORT, address=OLED_ADDRESS))
+        return _device
+
+def get_serial():
+    global _ser
+    with _lock:
+        if _ser is None:
+            import serial
+            _ser = serial.Serial(SERIAL_PORT, SERIAL_BAUD, timeout=1)
+            time.sleep(2)
+        return _ser
+
+def warm_up():
+    import servo
+    servo.get_link()
+    get_device()
+    get_camera()
+    get_hands()
+
+def close_all():
+    global _camera, _hands, _faces, _device, _ser
+    with _lock:
+        if _camera is not None:
+            _camera.stop()
+            _camera.close()
+            _camera = None
+        if _hands is not None:
+            _hands.close()
+            _hands = None
+        if _faces is not None:
+            _faces.close()
+            _faces = None
+        if _ser is not None:
+            import servo
+            servo.close()
+            _ser.close()
+            _ser = None
+        _device = None
@@ -0,0 +1,88 @@
+import os
+import re
+import sys
+import time
+import importlib.util
+import hardware
+
+APP_FOLDER = "/home/eyeay/BEVR BOT APPS"
+MENU_PATH = "/home/eyeay/app_menu.py"
+
+#plugin contract: an app module defines main() and may define start(host) / stop(host).
+#main() returns when the user leaves the app, the host then goes back to the menu.
+class AppHost:
+    def __init__(self, folder=APP_FOLDER):
+        self.folder = folder
+        self.modules = {}
+        self.current = None
+        if folder not in sys.path:
+            sys.path.insert(0, folder)
+        hardware.warm_up()
+        import vision
+        vision.start_service()
+
+    #the library modules the apps import live in the same folder, only files with a
+    #module-level main() are apps
+    def list_apps(self):
+        return sorted(f for f in os.listdir(self.folder) if f.endswith(".py") and self.is_app(f))
+
+    def is_app(self, filename):
+        try:
+            with open(os.path.join(self.folder, filename)) as f:
+                return re.search(r"^def main\(", f.read(), re.M) is not None
+        except OSError:
+            return False
+
+    def load(self, filename):
+        name = os.path.splitext(filename)[0]
+        module = self.modules.get(name)
+        if module is None:
+            #an app imported as a library already lives under this name, loading it again
+            #would replace the running module and whatever state it holds
+            if name in sys.modules:
+                raise ImportError(f"{name} is already loaded as a module")
+            t0 = time.time()
+            spec = importlib.util.spec_from_file_location(name, os.path.join(self.folder, filename))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[name]
+                raise
+            self.modules[name] = module
+            print(f"Loaded {name} in {time.time() - t0:.2f}s")
+        return module
+
+    def run_app(self, filename):
+        try:
+            module = self.load(filename)
+        except (Exception, SystemExit) as e:
+            print(f"Could not load {filename}:", e)
+            return None
+
+        self.current = module
+        result = None
+        t0 = time.time()
+        try:
+            if hasattr(module, "start"):
+                module.start(self)
+            print(f"Started {module.__name__} in {(time.time() - t0) * 1000:.0f} ms")
+            result = module.main()
+        except (Exception, SystemExit) as e:
+            print(f"{module.__name__} stopped with error:", e)
+        finally:
+            try:
+                if hasattr(module, "stop"):
+                    module.stop(self)
+            except Exception as e:
+                print(f"{module.__name__} stop hook failed:", e)
+            import preview
+            preview.close()
+            self.current = None
+        return result
+
+#standalone apps hand back to the menu by replacing their process
+def exec_menu():
+    hardware.close_all()
+    os.execvp("python3", ["python3", MENU_PATH])
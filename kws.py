@@ -0,0 +1,158 @@
+import sys
+import json
+import time
+import queue
+from collections import namedtuple
+import speech_recognition as sr
+import stt
+
+COMMANDS = {
+    "exit": "exit", "quit": "exit", "goodbye": "exit", "bye": "exit",
+    "menu": "menu",
+}
+COOLDOWN = 1.0  #same word is not reported twice within this many seconds
+
+MIN_CONFIDENCE = 0.85  #per-word vosk confidence a command needs
+
+Event = namedtuple("Event", "command word time")
+
+#command words in one final segment's word list; a segment that is mostly [unk] is someone
+#talking in sentences the grammar can't cover, its command words are guesses
+def spotted(words, commands=COMMANDS, min_confidence=MIN_CONFIDENCE):
+    unknown = sum(1 for w in words if w.get("word") == "[unk]")
+    found = [w["word"] for w in words if w.get("word") in commands and w.get("conf", 0.0) >= min_confidence]
+    if unknown > len(found):
+        return []
+    return found
+
+#keyword spotter on the live mic stream: a recognizer restricted to the command words
+#listens to every chunk and reports a word when a finished segment holds it with enough
+#confidence; partials are never trusted, with six words in the grammar "buy" already
+#decodes as "bye"
+class KeywordSpotter:
+    def __init__(self, backend, sample_rate, commands=COMMANDS):
+        self.commands = commands
+        self.rec = backend.recognizer(sample_rate, sorted(commands))
+        self.rec.SetWords(True)
+        self.events = queue.Queue()
+        self.last_fired = {}
+        self.swallow = False
+
+    def feed(self, chunk, now=None):
+        now = time.time() if now is None else now
+        try:
+            if not self.rec.AcceptWaveform(chunk):
+                return
+            words = json.loads(self.rec.Result()).get("result", [])
+        except Exception as e:
+            print("Keyword spotter error:", e)
+            return
+        for word in spotted(words, self.commands):
+            if now - self.last_fired.get(word, -COOLDOWN) >= COOLDOWN:
+                self.events.put(Event(self.commands[word], word, now))
+                self.last_fired[word] = now
+
+    def poll(self):
+        try:
+            return self.events.get_nowait()
+        except queue.Empty:
+            return None
+
+    def clear(self):
+        while self.poll() is not None:
+            pass
+
+#starts spotting on the listener's stream, None when no streaming backend is available
+def attach(listener, backend=None, commands=COMMANDS):
+    backend = backend or stt.get_backend()
+    if not backend.streaming:
+        return None
+    deadline = time.time() + 2
+    while not hasattr(listener, "sample_rate") and time.time() < deadline:
+        time.sleep(0.05)
+    spotter = KeywordSpotter(backend, listener.sample_rate, commands)
+    listener.taps.append(spotter.feed)
+    return spotter
+
+def detach(listener, spotter):
+    if spotter is not None and spotter.feed in listener.taps:
+        listener.taps.remove(spotter.feed)
+
+#waits for the next turn: a spotted command (returned as its word, nothing left to transcribe)
+#or a finished utterance; raises sr.WaitTimeoutError like Listener.listen
+def next_turn(listener, spotter, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+        event = spotter.poll() if spotter else None
+        if event is not None:
+            #the utterance the word was part of is answered already, drop it when it lands
+            spotter.swallow = listener.in_speech
+            listener.flush()
+            return event.word, None
+        try:
+            audio = listener.utterances.get(timeout=0.05)
+            if spotter and spotter.swallow:
+                spotter.swallow = False
+                continue
+            return None, audio
+        except queue.Empty:
+            pass
+        if time.time() >= deadline and not listener.in_speech:
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+
+#benchmark on recorded 16-bit mono wavs: keyword spotting vs transcribe-then-match
+#usage: python3 kws.py clip.wav [clip2.wav ...]
+def bench(paths, chunk_frames=1024):
+    import wave
+    from listener import rms, MIN_ENERGY, HANGOVER
+
+    backend = stt.get_backend()
+    if not backend.streaming:
+        print("Keyword spotting needs a streaming backend (vosk)")
+        return
+    for path in paths:
+        with wave.open(path, "rb") as f:
+            rate, width = f.getframerate(), f.getsampwidth()
+            data = f.readframes(f.getnframes())
+        chunk_bytes = chunk_frames * width
+        chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+        chunk_time = chunk_frames / rate
+        duration = len(chunks) * chunk_time
+        speech_end = max([i for i, c in enumerate(chunks) if rms(c) > MIN_ENERGY] or [len(chunks) - 1])
+        speech_end = (speech_end + 1) * chunk_time
+
+        #keyword path: chunks fed as if live, latency = audio time + compute at the first event - end of speech
+        spotter = KeywordSpotter(backend, rate)
+        cpu0 = time.process_time()
+        compute = 0.0
+        detected = None
+        for i, chunk in enumerate(chunks):
+            t0 = time.perf_counter()
+            spotter.feed(chunk, now=i * chunk_time)
+            compute += time.perf_counter() - t0
+            event = spotter.poll()
+            if event and detected is None:
+                detected = (event.word, (i + 1) * chunk_time + compute - speech_end)
+        kws_cpu = time.process_time() - cpu0
+
+        #transcribe path: hangover before the utterance is closed, then a full transcription and a substring match
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        try:
+            text = backend.transcribe(sr.AudioData(data, rate, width))
+        except sr.UnknownValueError:
+            text = ""
+        transcribe_time = time.perf_counter() - t0
+        full_cpu = time.process_time() - cpu0
+        matched = next((w for w in text.lower().split() if w in COMMANDS), None)
+
+        print(path)
+        if detected:
+            print(f"  spotter:    {detected[0]!r} at {detected[1] * 1000:+.0f} ms from end of speech, cpu {kws_cpu / duration:.2f}x realtime")
+        else:
+            print(f"  spotter:    nothing, cpu {kws_cpu / duration:.2f}x realtime")
+        print(f"  transcribe: {matched!r} at {(HANGOVER + transcribe_time) * 1000:+.0f} ms from end of speech, "
+              f"cpu {full_cpu / duration:.2f}x realtime ({text!r})")
+
+if __name__ == "__main__":
+    bench(sys.argv[1:])
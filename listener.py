@@ -0,0 +1,215 @@
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import speech_recognition as sr
+
+MIC_INDEX = 2
+SPEECH_RATIO = 2.0  #chunk counts as speech when this many times louder than the noise floor
+MIN_ENERGY = 150  #and never below this, so a silent room doesn't make every click speech
+FLOOR_TIME = 1.5  #seconds for the noise floor to follow a change in background level
+#a level that never dips this long inside an utterance is background (a fan, the music), not speech;
+#words always have gaps, so the floor only rises to the quietest chunk of the window
+FLOOR_WINDOW = 2.5
+START_TIME = 0.06  #speech needed before an utterance starts
+HANGOVER = 0.7  #silence that ends an utterance
+PRE_ROLL = 0.3  #audio kept from before the utterance started
+MIN_PHRASE = 0.3
+MAX_PHRASE = 10.0
+MAX_QUEUED = 4  #utterances kept for a turn that hasn't asked yet, the oldest go first
+
+def rms(chunk):
+    samples = np.frombuffer(chunk, np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+#keeps the mic open, tracks the noise floor as it goes and queues finished utterances,
+#so a turn can start the moment the previous one ends
+class Listener(threading.Thread):
+    def __init__(self, mic):
+        super().__init__(name="listener", daemon=True)
+        self.mic = mic
+        self.utterances = queue.Queue(maxsize=MAX_QUEUED)
+        self.running = True
+        #cleared while no app is listening, the mic is closed until resume()
+        self.active = threading.Event()
+        self.active.set()
+        self.muted = 0
+        self.in_speech = False
+        self.noise_floor = None
+        self.lock = threading.Lock()
+        #(backend, grammar) that decodes utterances while they are spoken, see stt.py
+        self.decoder = None
+        self.partial = ""
+        #callables fed every unmuted chunk, e.g. the keyword spotter
+        self.taps = []
+
+    def run(self):
+        while self.running:
+            if not self.active.wait(0.5):
+                continue
+            self._capture()
+
+    def _capture(self):
+        self.in_speech = False
+        self.partial = ""
+        with self.mic as source:
+            self.sample_rate = source.SAMPLE_RATE
+            self.sample_width = source.SAMPLE_WIDTH
+            chunk_time = source.CHUNK / source.SAMPLE_RATE
+            ring = deque(maxlen=max(1, int(PRE_ROLL / chunk_time)))
+            alpha = min(1.0, chunk_time / FLOOR_TIME)
+            recent = deque(maxlen=max(1, int(FLOOR_WINDOW / chunk_time)))
+            noise = False
+            phrase = []
+            session = None
+            loud = 0.0
+            quiet = 0.0
+
+            while self.running and self.active.is_set():
+                chunk = source.stream.read(source.CHUNK)
+                if self.muted:
+                    phrase, loud, quiet = [], 0.0, 0.0
+                    self.in_speech = False
+                    session = None
+                    ring.clear()
+                    continue
+
+                for tap in tuple(self.taps):
+                    tap(chunk)
+
+                energy = rms(chunk)
+                if self.noise_floor is None:
+                    self.noise_floor = energy
+                speech = energy > max(MIN_ENERGY, self.noise_floor * SPEECH_RATIO)
+
+                if not self.in_speech:
+                    ring.append(chunk)
+                    if speech:
+                        loud += chunk_time
+                        if loud >= START_TIME:
+                            self.in_speech = True
+                            phrase = list(ring)
+                            quiet = 0.0
+                            recent.clear()
+                            noise = False
+                            session = self._open_session()
+                            for pending in phrase:
+                                self._feed(session, pending)
+                    else:
+                        loud = 0.0
+                        self.noise_floor += alpha * (energy - self.noise_floor)
+                    continue
+
+                phrase.append(chunk)
+                self._feed(session, chunk)
+                recent.append(energy)
+                if len(recent) == recent.maxlen and min(recent) > self.noise_floor:
+                    lowest = min(recent)
+                    noise = noise or lowest > max(MIN_ENERGY, self.noise_floor * SPEECH_RATIO)
+                    self.noise_floor = lowest
+                    speech = energy > max(MIN_ENERGY, self.noise_floor * SPEECH_RATIO)
+                quiet = 0.0 if speech else quiet + chunk_time
+                duration = len(phrase) * chunk_time
+                if quiet >= HANGOVER or duration >= MAX_PHRASE:
+                    #an utterance that never dipped to speech-free level was the background getting louder
+                    if duration - quiet >= MIN_PHRASE and not noise:
+                        audio = sr.AudioData(b"".join(phrase), self.sample_rate, self.sample_width)
+                        audio.text = self._close_session(session)
+                        self._queue(audio)
+                    self.in_speech = False
+                    self.partial = ""
+                    session = None
+                    phrase, loud = [], 0.0
+                    ring.clear()
+
+    def _queue(self, audio):
+        while True:
+            try:
+                self.utterances.put_nowait(audio)
+                return
+            except queue.Full:
+                try:
+                    self.utterances.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _open_session(self):
+        decoder = self.decoder
+        if decoder is None or not decoder[0].streaming:
+            return None
+        try:
+            return decoder[0].stream(self.sample_rate, decoder[1])
+        except Exception as e:
+            print("Could not start streaming recognition:", e)
+            return None
+
+    def _feed(self, session, chunk):
+        if session is not None:
+            self.partial = session.feed(chunk)
+
+    #None means the utterance still needs a full transcription
+    def _close_session(self, session):
+        if session is None:
+            return None
+        try:
+            return session.result()
+        except Exception as e:
+            print("Streaming recognition failed:", e)
+            return None
+
+    #next finished utterance; raises sr.WaitTimeoutError if nobody started talking within timeout
+    def listen(self, timeout=5):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                if not self.in_speech:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                remaining = MAX_PHRASE
+            try:
+                return self.utterances.get(timeout=min(remaining, 0.1))
+            except queue.Empty:
+                continue
+
+    def flush(self):
+        while True:
+            try:
+                self.utterances.get_nowait()
+            except queue.Empty:
+                return
+
+    #drop everything heard while the robot itself is talking
+    @contextmanager
+    def mute(self):
+        with self.lock:
+            self.muted += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.muted -= 1
+
+    #closes the mic between apps so nothing is captured, queued or decoded meanwhile
+    def pause(self):
+        self.active.clear()
+        self.flush()
+
+    def resume(self):
+        self.active.set()
+
+    def stop(self):
+        self.running = False
+        self.join(timeout=1)
+
+_listener = None
+_lock = threading.Lock()
+
+def get_listener(device_index=MIC_INDEX):
+    global _listener
+    with _lock:
+        if _listener is None:
+            _listener = Listener(sr.Microphone(device_index=device_index))
+            _listener.start()
+        return _listener
@@ -0,0 +1,146 @@
+import os
+import re
+import json
+import threading
+
+#end of a sentence: punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+MIN_SENTENCE = 12  #shorter sentences are held back and spoken with the next one
+
+#text deltas of a streamed chat completion as they arrive
+def stream_deltas(client, model, messages):
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+#regroups a stream of text deltas into whole sentences as soon as each one is complete
+def split_sentences(deltas, min_length=MIN_SENTENCE):
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        while True:
+            match = SENTENCE_END.search(buffer, min(min_length, len(buffer)))
+            if match is None:
+                break
+            sentence = buffer[:match.end()].strip()
+            buffer = buffer[match.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+#rough token count, exact when tiktoken is installed
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except ImportError:
+    def count_tokens(text):
+        return len(text) // 4 + 1
+
+MESSAGE_OVERHEAD = 4
+TOKEN_BUDGET = 1200  #history tokens sent per request, system prompt and summary not included
+KEEP_TURNS = 6  #recent messages that are never folded into the summary
+SUMMARY_PROMPT = ("Update the summary of this chat between a small robot and a person. "
+                  "Keep names, preferences and facts worth remembering, at most four short sentences.")
+
+#system prompt + rolling summary + sliding window of recent turns; turns that fall out of
+#the token budget are folded into the summary in the background so replies never wait on it
+class Conversation:
+    def __init__(self, system_prompt, summarize=None, budget=TOKEN_BUDGET, keep=KEEP_TURNS):
+        self.system_prompt = system_prompt
+        self.summarize = summarize
+        self.budget = budget
+        self.keep = keep
+        self.summary = ""
+        self.turns = []
+        self.lock = threading.Lock()
+        self.compacting = False
+
+    def add(self, role, content):
+        with self.lock:
+            self.turns.append({"role": role, "content": content})
+
+    def messages(self):
+        with self.lock:
+            system = self.system_prompt
+            if self.summary:
+                system += "\n\nWhat you remember from earlier in this chat: " + self.summary
+            return [{"role": "system", "content": system}] + list(self.turns)
+
+    def tokens(self, messages=None):
+        messages = self.messages() if messages is None else messages
+        return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+    #oldest turns beyond the budget, always leaving the last `keep` messages alone
+    def _overflow(self):
+        total = sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in self.turns)
+        count = 0
+        while total > self.budget and len(self.turns) - count > self.keep:
+            total -= count_tokens(self.turns[count]["content"]) + MESSAGE_OVERHEAD
+            count += 1
+        return count
+
+    def compact(self):
+        with self.lock:
+            count = self._overflow()
+            if not count:
+                return
+            old = self.turns[:count]
+            summary = self.summary
+        if self.summarize:
+            try:
+                summary = self.summarize(summary, old)
+            except Exception as e:
+                print("Could not summarize conversation:", e)
+        with self.lock:
+            self.summary = summary
+            self.turns = self.turns[count:]
+
+    def compact_async(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self.compacting = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def save(self, path):
+        with self.lock:
+            data = {"system_prompt": self.system_prompt, "summary": self.summary, "turns": self.turns}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, path)
+
+    #the saved system prompt is ignored so prompt edits take effect on old sessions
+    def load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        with self.lock:
+            self.summary = data.get("summary", "")
+            self.turns = data.get("turns", [])
+
+#summarizer for Conversation backed by a chat completions client
+def make_summarizer(client, model, max_tokens=120):
+    def summarize(summary, turns):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+        response = client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Summary so far: {summary or 'nothing yet'}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        return response.choices[0].message.content.strip()
+    return summarize
@@ -0,0 +1,223 @@
+import sys
+import time
+import threading
+import numpy as np
+
+BLOCK = 512  #frames per callback, ~12 ms at 44.1 kHz
+GAIN_TIME = 0.03  #seconds for a gain change to mostly settle
+FADE = 0.05  #seconds faded out before the stream stops
+
+#all stems of a song read in lock-step from one position and mixed into one output stream;
+#gains move towards their targets once per block and are ramped sample by sample inside it
+class StemMixer:
+    def __init__(self, block=BLOCK, gain_time=GAIN_TIME):
+        self.block = block
+        self.gain_time = gain_time
+        self.lock = threading.Lock()
+        self.audio = None
+        self.stream = None
+        self.rate = None
+        self.song = None
+        self.pcm = []
+        self.names = []
+        self.pos = 0
+        self.loop = True
+        self.gains = np.zeros(0, np.float32)
+        self.target = np.zeros(0, np.float32)
+        self.alpha = 1.0
+        self.channels = 2
+        self._buffers(block)
+        self.blocks = 0
+        self.busy = 0.0
+
+    def play(self, song, gains=None, loop=True):
+        self.load(song, gains, loop)
+        self._open(song.rate, self.channels)
+
+    #puts the song at its start, play() also opens the output stream
+    def load(self, song, gains=None, loop=True):
+        with self.lock:
+            self.song = song
+            self.names = list(song.pcm)
+            self.pcm = [song.pcm[name] for name in self.names]
+            self.pos = 0
+            self.loop = loop
+            self.target = np.ones(len(self.names), np.float32)
+            if gains:
+                self.set_gains(gains)
+            self.gains = self.target.copy()
+            self.alpha = 1.0 - np.exp(-self.block / (song.rate * self.gain_time))
+            self.channels = self.pcm[0].shape[1]
+            self._buffers(self.block)
+
+    #target gain per stem name, picked up by the next audio block
+    def set_gains(self, gains):
+        target = self.target.copy()
+        for i, name in enumerate(self.names):
+            if name in gains:
+                target[i] = gains[name]
+        self.target = target
+
+    #playback position in seconds, what the dance follows
+    def position(self):
+        song = self.song
+        return self.pos / song.rate if song else 0.0
+
+    def playing(self):
+        return self.song is not None
+
+    def stop(self):
+        if self.stream is not None and self.song is not None:
+            self.target = np.zeros_like(self.target)
+            time.sleep(FADE)
+        with self.lock:
+            self.song = None
+            self.pcm = []
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        self.stop()
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+
+    def stats(self):
+        budget = self.block / self.rate if self.rate else 0.0
+        busy = self.busy / max(self.blocks, 1)
+        return f"mixer: {busy * 1000:.2f} ms/block ({busy / budget * 100 if budget else 0:.1f}% of budget)"
+
+    def _open(self, rate, channels):
+        if self.stream is not None and self.rate == rate:
+            return
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+        #imported here so the benchmark runs where there is no audio stack
+        import pyaudio
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+        self.continue_flag = pyaudio.paContinue
+        self.rate = rate
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=channels, rate=rate, output=True,
+                                      frames_per_buffer=self.block, stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def _buffers(self, frames):
+        self.ramp = np.arange(1, frames + 1, dtype=np.float32) / frames
+        self.scratch = np.empty((frames, self.channels), np.float32)
+        self.mixed = np.empty((frames, self.channels), np.float32)
+        self.out = np.empty((frames, self.channels), np.int16)
+        self.steps = np.empty(frames, np.float32)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        t0 = time.perf_counter()
+        data = self.mix(frame_count)
+        self.busy += time.perf_counter() - t0
+        self.blocks += 1
+        return data, self.continue_flag
+
+    #the next block of output as int16 bytes, silence when nothing is playing
+    def mix(self, frames):
+        with self.lock:
+            if len(self.ramp) != frames:
+                self._buffers(frames)
+            if self.song is None:
+                self.out.fill(0)
+                return self.out.tobytes()
+            mixed = self.mixed
+            mixed.fill(0)
+
+            start = self.gains
+            end = start + (self.target - start) * self.alpha
+            for i, pcm in enumerate(self.pcm):
+                self._read(pcm, self.scratch)
+                np.multiply(self.ramp, end[i] - start[i], out=self.steps)
+                self.steps += start[i]
+                self.scratch *= self.steps[:, None]
+                mixed += self.scratch
+            self.gains = end.astype(np.float32)
+            self._advance(frames)
+
+            np.clip(mixed, -32768, 32767, out=mixed)
+            np.copyto(self.out, mixed, casting="unsafe")
+            return self.out.tobytes()
+
+    def _read(self, pcm, dst):
+        frames = len(dst)
+        total = self.song.frames
+        pos = self.pos
+        done = 0
+        while done < frames:
+            n = min(frames - done, total - pos)
+            if n <= 0:
+                if not self.loop:
+                    dst[done:] = 0
+                    return
+                pos = 0
+                continue
+            np.copyto(dst[done:done + n], pcm[pos:pos + n], casting="unsafe")
+            done += n
+            pos += n
+
+    def _advance(self, frames):
+        pos = self.pos + frames
+        if pos >= self.song.frames:
+            if not self.loop:
+                self.song = None
+                return
+            pos %= self.song.frames
+        self.pos = pos
+
+_mixer = None
+_lock = threading.Lock()
+
+def get_mixer():
+    global _mixer
+    with _lock:
+        if _mixer is None:
+            _mixer = StemMixer()
+        return _mixer
+
+#mixing cost per block against the time the block lasts, without opening an output device
+def bench(song, seconds=10.0, block=BLOCK):
+    engine = StemMixer(block=block)
+    engine.load(song)
+    count = int(seconds * song.rate / block)
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    for n in range(count):
+        if n % 3 == 0:
+            engine.target = rng.random(len(engine.names)).astype(np.float32)
+        engine.mix(block)
+    elapsed = time.perf_counter() - t0
+    print(f"{count} blocks of {block} frames: {elapsed / count * 1e6:.0f} us/block, "
+          f"{seconds / elapsed:.0f}x realtime")
+
+#usage: python3 mixer.py --bench [song] | --play song
+#without a song the benchmark mixes four stems of noise
+if __name__ == "__main__":
+    import stems
+    args = sys.argv[1:]
+    if args[:1] == ["--bench"]:
+        if len(args) > 1:
+            song = stems.get_loader().get(args[1])
+        else:
+            rng = np.random.default_rng(0)
+            shape = (stems.RATE * 30, stems.CHANNELS)
+            song = stems.Song("noise", stems.RATE, {name: rng.integers(-8000, 8000, shape, dtype=np.int16)
+                                                    for name in stems.STEM_FILES})
+        bench(song)
+    elif args[:1] == ["--play"] and len(args) > 1:
+        engine = get_mixer()
+        engine.play(stems.get_loader().get(args[1]))
+        try:
+            while True:
+                time.sleep(2)
+                print(f"{engine.position():.1f}s", engine.stats())
+        except KeyboardInterrupt:
+            engine.close()
+    else:
+        print("usage: python3 mixer.py --bench [song] | --play song")
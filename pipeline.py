@@ -0,0 +1,92 @@
+import time
+import threading
+
+#single-slot queue, a new item replaces the one nobody picked up yet
+class LatestQueue:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._full = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full:
+                self.dropped += 1
+            self._item = item
+            self._full = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._full, timeout):
+                return None
+            item = self._item
+            self._item = None
+            self._full = False
+            return item
+
+#fps, work time per item and age of the frame when the stage finished with it
+class StageStats:
+    def __init__(self, name, window=1.0):
+        self.name = name
+        self.window = window
+        self.fps = 0.0
+        self.busy_ms = 0.0
+        self.age_ms = 0.0
+        self._reset(time.time())
+
+    def _reset(self, now):
+        self._since = now
+        self._count = 0
+        self._busy = 0.0
+        self._age = 0.0
+
+    def record(self, started, stamp=None):
+        now = time.time()
+        self._count += 1
+        self._busy += now - started
+        if stamp:
+            self._age += now - stamp
+        elapsed = now - self._since
+        if elapsed >= self.window:
+            self.fps = self._count / elapsed
+            self.busy_ms = self._busy / self._count * 1000
+            self.age_ms = self._age / self._count * 1000
+            self._reset(now)
+
+    def __str__(self):
+        return f"{self.name}: {self.fps:.1f} fps {self.busy_ms:.1f} ms +{self.age_ms:.0f} ms"
+
+#worker thread: takes the latest item from inbox (or produces one when inbox is None),
+#runs fn on it and hands any result to outbox
+class Stage(threading.Thread):
+    def __init__(self, name, fn, inbox=None, outbox=None, stamp=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stamp = stamp
+        self.stats = StageStats(name)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            if self.inbox is None:
+                started = time.time()
+                out = self.fn()
+                if out is None:
+                    continue
+            else:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    continue
+                started = time.time()
+                out = self.fn(item)
+            self.stats.record(started, self.stamp(out) if self.stamp and out is not None else None)
+            if out is not None and self.outbox is not None:
+                self.outbox.put(out)
+
+    def stop(self):
+        self.running = False
+        self.join(timeout=1)
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+#BEVR_HEADLESS=1 skips every window and debug overlay; BEVR_PREVIEW=<port> serves the
+#debug view as mjpeg at http://<robot>:<port>/ instead, encoded only while someone watches
+HEADLESS = os.environ.get("BEVR_HEADLESS", "0") == "1"
+PREVIEW_PORT = int(os.environ.get("BEVR_PREVIEW", "0") or 0)
+PREVIEW_FPS = 10
+JPEG_QUALITY = 70
+BOUNDARY = b"frame"
+
+PAGE = b"<html><body style='margin:0;background:#000'><img src='/stream' style='width:100%'></body></html>"
+
+class PreviewServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port, fps=PREVIEW_FPS):
+        super().__init__(("0.0.0.0", port), Handler)
+        self.interval = 1.0 / fps
+        self.cond = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.clients = 0
+        self.last_encode = 0.0
+
+    #a frame is only worth drawing when someone is watching and the last one is old enough
+    def due(self):
+        return self.clients > 0 and time.monotonic() - self.last_encode >= self.interval
+
+    def publish(self, image):
+        if not self.due():
+            return
+        self.last_encode = time.monotonic()
+        ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if ok:
+            with self.cond:
+                self.jpeg = jpeg.tobytes()
+                self.seq += 1
+                self.cond.notify_all()
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+            return
+        if self.path != "/stream":
+            self.send_error(404)
+            return
+
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with server.cond:
+            server.clients += 1
+        seen = server.seq
+        try:
+            while True:
+                with server.cond:
+                    server.cond.wait_for(lambda: server.seq != seen, timeout=1.0)
+                    if server.seq == seen:
+                        continue
+                    seen, jpeg = server.seq, server.jpeg
+                self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                 + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.cond:
+                server.clients -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_lock = threading.Lock()
+
+def get_server(port=PREVIEW_PORT):
+    global _server
+    with _lock:
+        if _server is None and port:
+            _server = PreviewServer(port)
+            threading.Thread(target=_server.serve_forever, name="preview", daemon=True).start()
+            print(f"Preview on http://0.0.0.0:{port}/")
+        return _server
+
+#whether this frame's debug view will be seen at all, apps skip conversion and drawing otherwise
+def wanted():
+    if not HEADLESS:
+        return True
+    server = get_server()
+    return server is not None and server.due()
+
+#shows a bgr debug frame in the window and/or the preview stream
+def show(title, image):
+    if not HEADLESS:
+        cv2.imshow(title, image)
+    server = get_server()
+    if server is not None:
+        server.publish(image)
+
+#window key press like cv2.waitKey(1) & 0xFF, -1 without a window
+def key():
+    if HEADLESS:
+        return -1
+    return cv2.waitKey(1) & 0xFF
+
+def close():
+    if not HEADLESS:
+        cv2.destroyAllWindows()
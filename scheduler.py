@@ -0,0 +1,118 @@
+import time
+import threading
+
+TICK = 0.02
+
+#keyframes are (seconds from start, callable) pairs in time order, any iterable works
+#so a generator can describe an endless trajectory that runs until cancelled
+class Timeline:
+    def __init__(self, channel, keyframes):
+        self.channel = channel
+        self.keyframes = iter(keyframes)
+        self.pending = next(self.keyframes, None)
+        self.start = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.cancelled = True
+        self.done.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    #fires every keyframe that is due, returns False once the timeline is finished
+    def step(self, now):
+        if self.start is None:
+            self.start = now
+        while self.pending is not None and not self.cancelled:
+            offset, action = self.pending
+            if self.start + offset > now:
+                return True
+            try:
+                action()
+            except Exception as e:
+                print(f"Animation error on {self.channel}:", e)
+            self.pending = next(self.keyframes, None)
+        self.done.set()
+        return False
+
+#runs eye and servo timelines on a fixed tick in the background, one timeline per channel;
+#playing on a busy channel pre-empts whatever was running there
+class Scheduler(threading.Thread):
+    def __init__(self, tick=TICK):
+        super().__init__(name="animations", daemon=True)
+        self.tick = tick
+        self.timelines = {}
+        self.cond = threading.Condition()
+        self.running = True
+
+    def play(self, channel, keyframes):
+        timeline = Timeline(channel, keyframes)
+        with self.cond:
+            previous = self.timelines.get(channel)
+            if previous is not None:
+                previous.cancel()
+            self.timelines[channel] = timeline
+            self.cond.notify()
+        return timeline
+
+    def cancel(self, channel=None):
+        with self.cond:
+            channels = list(self.timelines) if channel is None else [channel]
+            for name in channels:
+                timeline = self.timelines.pop(name, None)
+                if timeline is not None:
+                    timeline.cancel()
+
+    def busy(self, channel):
+        with self.cond:
+            timeline = self.timelines.get(channel)
+            return timeline is not None and not timeline.done.is_set()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while self.running:
+            with self.cond:
+                if not self.timelines:
+                    self.cond.wait(0.5)
+                    next_tick = time.monotonic()
+                    continue
+                active = list(self.timelines.items())
+
+            now = time.monotonic()
+            for channel, timeline in active:
+                if not timeline.step(now):
+                    with self.cond:
+                        if self.timelines.get(channel) is timeline:
+                            del self.timelines[channel]
+
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                with self.cond:
+                    self.cond.wait(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def stop(self):
+        self.cancel()
+        self.running = False
+        with self.cond:
+            self.cond.notify()
+        self.join(timeout=1)
+
+#evenly spaced keyframes, one per item
+def frames(items, interval, action, start=0.0):
+    return [(start + i * interval, lambda item=item: action(item)) for i, item in enumerate(items)]
+
+_scheduler = None
+_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+            _scheduler.start()
+        return _scheduler
@@ -0,0 +1,105 @@
+import os
+import time
+import queue
+import threading
+import hardware
+
+TICK = 0.02
+#binary frame: 0xFF, pan, tilt, left, right, checksum (sum & 0x7F); angles are 0-180 so 0xFF only ever marks a frame start
+BINARY_FRAMES = os.environ.get("SERVO_BINARY", "0") == "1"
+FRAME_START = 0xFF
+
+def encode(pose, binary=False):
+    angles = [max(0, min(180, int(a))) for a in pose]
+    if binary:
+        return bytes([FRAME_START] + angles + [sum(angles) & 0x7F])
+    return (",".join(str(a) for a in angles) + "\n").encode("utf-8")
+
+#the only writer on the servo port; callers queue poses and every tick only the newest
+#one goes out, older targets that were never sent get merged away
+class ServoLink(threading.Thread):
+    def __init__(self, ser, tick=TICK, binary=BINARY_FRAMES):
+        super().__init__(name="servo", daemon=True)
+        self.ser = ser
+        self.tick = tick
+        self.binary = binary
+        self.commands = queue.Queue()
+        self.running = True
+        self.last_pose = None
+        self.sent = 0
+        self.merged = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def move(self, pan, tilt, left, right):
+        self.commands.put((time.monotonic(), (pan, tilt, left, right)))
+
+    def run(self):
+        while self.running:
+            try:
+                item = self.commands.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            depth = 1
+            while True:
+                try:
+                    item = self.commands.get_nowait()
+                    depth += 1
+                except queue.Empty:
+                    break
+            self.depth = depth
+            self.max_depth = max(self.max_depth, depth)
+            self.merged += depth - 1
+
+            queued_at, pose = item
+            started = time.monotonic()
+            self.ser.write(encode(pose, self.binary))
+            self.ser.flush()
+            done = time.monotonic()
+            self.last_pose = pose
+            self.sent += 1
+            latency = (done - queued_at) * 1000
+            self.latency_ms = 0.9 * self.latency_ms + 0.1 * latency if self.sent > 1 else latency
+            self.max_latency_ms = max(self.max_latency_ms, latency)
+
+            delay = self.tick - (done - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    #blocks until everything queued so far has been written
+    def drain(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while not self.commands.empty() and time.monotonic() < deadline:
+            time.sleep(self.tick / 2)
+
+    def stop(self):
+        self.drain()
+        self.running = False
+        self.join(timeout=1)
+
+    def stats(self):
+        return (f"servo: {self.sent} sent, {self.merged} merged, depth {self.depth} (max {self.max_depth}), "
+                f"{self.latency_ms:.1f} ms (max {self.max_latency_ms:.1f} ms)")
+
+_link = None
+_lock = threading.Lock()
+
+def get_link():
+    global _link
+    with _lock:
+        if _link is None:
+            _link = ServoLink(hardware.get_serial())
+            _link.start()
+        return _link
+
+def move_servos(pan, tilt, left, right):
+    get_link().move(pan, tilt, left, right)
+
+def close():
+    global _link
+    with _lock:
+        if _link is not None:
+            _link.stop()
+            _link = None
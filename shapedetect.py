@@ -0,0 +1,187 @@
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+import cv2
+
+#hsv ranges (opencv hue 0-180) of the cards the kids hold up, any number can be searched at once
+COLOR_RANGES = {
+    "blue": ((90, 80, 50), (130, 255, 255)),
+}
+MIN_AREA = 500
+KERNEL = 5
+EPSILON = 0.04  #polygon fit tolerance as a share of the perimeter
+SHAPES = ["triangle", "square", "star", "circle"]
+
+Shape = namedtuple("Shape", "name color area box contour")
+
+#thresholds every colour range into reused buffers, measures every contour once and
+#classifies them all together
+class ShapeDetector:
+    def __init__(self, width, height, ranges=COLOR_RANGES, min_area=MIN_AREA, kernel=KERNEL):
+        self.ranges = {color: (np.array(lo, np.uint8), np.array(hi, np.uint8)) for color, (lo, hi) in ranges.items()}
+        self.min_area = min_area
+        self.kernel = np.ones((kernel, kernel), np.uint8)
+        self.hsv = np.empty((height, width, 3), np.uint8)
+        self.mask = np.empty((height, width), np.uint8)
+
+    def masks(self, rgb):
+        cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV, dst=self.hsv)
+        for color, (lo, hi) in self.ranges.items():
+            cv2.inRange(self.hsv, lo, hi, dst=self.mask)
+            cv2.morphologyEx(self.mask, cv2.MORPH_CLOSE, self.kernel, dst=self.mask)
+            yield color, self.mask
+
+    #every shape in the frame, largest first
+    def detect(self, rgb):
+        contours, colors = [], []
+        for color, mask in self.masks(rgb):
+            found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            contours.extend(found)
+            colors.extend([color] * len(found))
+        if not contours:
+            return []
+
+        feats = features(contours, self.min_area)
+        labels = classify(feats)
+        shapes = [Shape(SHAPES[label], colors[i], float(feats[i, 0]), tuple(int(v) for v in feats[i, 5:9]), contours[i])
+                  for i, label in enumerate(labels) if label >= 0]
+        shapes.sort(key=lambda shape: -shape.area)
+        return shapes
+
+#area, perimeter, polygon sides, aspect ratio, solidity and bounding box per contour;
+#contours under min_area stop after their area and are left as zeros
+def features(contours, min_area=MIN_AREA):
+    feats = np.zeros((len(contours), 9), np.float32)
+    for i, contour in enumerate(contours):
+        area = cv2.contourArea(contour)
+        feats[i, 0] = area
+        if area < min_area:
+            continue
+        peri = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, EPSILON * peri, True)
+        x, y, w, h = cv2.boundingRect(approx)
+        hull = cv2.contourArea(cv2.convexHull(contour))
+        feats[i, 1:9] = (peri, len(approx), w / max(h, 1), area / hull if hull else 0.0, x, y, w, h)
+    return feats
+
+#index into SHAPES per contour, -1 for anything else
+def classify(feats, min_area=MIN_AREA):
+    area, peri, sides, aspect, solidity = (feats[:, i] for i in range(5))
+    circularity = np.where(peri > 0, 4 * np.pi * area / np.maximum(peri * peri, 1e-6), 0)
+    big = area >= min_area
+    conditions = [
+        big & (sides == 3),
+        big & (sides == 4) & (aspect >= 0.95) & (aspect <= 1.05),
+        big & (sides >= 8) & (sides <= 12) & (solidity < 0.8),
+        big & (sides > 6) & (circularity > 0.7) & (circularity < 1.2),
+    ]
+    return np.select(conditions, [0, 1, 2, 3], -1)
+
+#labelled frames: one shape per frame at a random size, place and angle on a dark noisy
+#background (too dark to pass any range), plus empty frames labelled -1
+def synthesize(count=60, width=640, height=480, seed=0, color="blue"):
+    rng = np.random.default_rng(seed)
+    lo, hi = COLOR_RANGES[color]
+    hsv = np.array([(lo[0] + hi[0]) // 2, 200, 200], np.uint8).reshape(1, 1, 3)
+    fill = tuple(int(v) for v in cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)[0, 0])
+    frames = np.empty((count, height, width, 3), np.uint8)
+    labels = np.empty(count, np.int64)
+    for n in range(count):
+        frame = frames[n]
+        frame[:] = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+        label = int(rng.integers(-1, len(SHAPES)))
+        labels[n] = label
+        if label < 0:
+            continue
+        r = int(rng.integers(50, 120))
+        cx, cy = int(rng.integers(r + 5, width - r - 5)), int(rng.integers(r + 5, height - r - 5))
+        angle = rng.uniform(0, 2 * np.pi)
+        name = SHAPES[label]
+        if name == "circle":
+            cv2.circle(frame, (cx, cy), r, fill, -1)
+            continue
+        if name == "triangle":
+            radii, corners = [r] * 3, 3
+        elif name == "square":
+            radii, corners = [r] * 4, 4
+        else:
+            radii, corners = [r, r * 0.45] * 5, 10
+        t = angle + np.arange(corners) * 2 * np.pi / corners
+        points = np.stack([cx + np.array(radii) * np.cos(t), cy + np.array(radii) * np.sin(t)], axis=1)
+        cv2.fillPoly(frame, [points.astype(np.int32)], fill)
+    return frames, labels
+
+#the original per-contour loop, first hit wins, for the benchmark
+def legacy(rgb):
+    display_frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    hsv = cv2.cvtColor(display_frame, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, (90, 80, 50), (130, 255, 255))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        if cv2.contourArea(contour) < 500:
+            continue
+        peri = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.04 * peri, True)
+        sides = len(approx)
+        if sides == 3:
+            return "triangle"
+        elif sides == 4:
+            x, y, w, h = cv2.boundingRect(approx)
+            if 0.95 <= w / float(h) <= 1.05:
+                return "square"
+        elif 8 <= sides <= 12:
+            return "star"
+        elif sides > 6:
+            area = cv2.contourArea(contour)
+            if area and 0.7 < 4 * np.pi * (area / (peri * peri)) < 1.2:
+                return "circle"
+    return None
+
+def check(frames, labels):
+    detector = ShapeDetector(frames.shape[2], frames.shape[1])
+    results = {"engine": [], "legacy": []}
+    for frame in frames:
+        shapes = detector.detect(frame)
+        results["engine"].append(shapes[0].name if shapes else None)
+        results["legacy"].append(legacy(frame))
+    truth = [SHAPES[label] if label >= 0 else None for label in labels]
+    for name, found in results.items():
+        print(f"{name:7s} {np.mean([a == b for a, b in zip(found, truth)]):.3f} accuracy on {len(truth)} frames")
+        for shape in SHAPES + [None]:
+            picked = [a == b for a, b in zip(found, truth) if b == shape]
+            if picked:
+                print(f"  {str(shape):8s} {np.mean(picked):.3f} ({len(picked)})")
+
+def bench(frames, rounds=3):
+    detector = ShapeDetector(frames.shape[2], frames.shape[1])
+    for name, fn in [("legacy", legacy), ("engine", detector.detect)]:
+        fn(frames[0])
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for frame in frames:
+                fn(frame)
+        print(f"{name:7s} {rounds * len(frames) / (time.perf_counter() - t0):7.1f} fps")
+
+#usage: python3 shapedetect.py --synth path.npz [count] | --check [path.npz] | --bench [path.npz]
+#without a path the labelled frames are generated in memory
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def load(index=1):
+        if len(args) > index:
+            with np.load(args[index]) as data:
+                return data["frames"], data["labels"]
+        return synthesize()
+
+    if args[:1] == ["--synth"]:
+        frames, labels = synthesize(int(args[2]) if len(args) > 2 else 60)
+        np.savez_compressed(args[1], frames=frames, labels=labels)
+        print(f"Saved {len(frames)} labelled frames to {args[1]}")
+    elif args[:1] == ["--check"]:
+        check(*load())
+    elif args[:1] == ["--bench"]:
+        bench(load()[0])
+    else:
+        print("usage: python3 shapedetect.py --synth path.npz [count] | --check [path.npz] | --bench [path.npz]")
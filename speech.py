@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from gtts import gTTS
+import pygame
+
+LANG = "en"
+TLD = "co.uk"
+CACHE_DIR = os.path.expanduser("~/.cache/bevr/tts")
+CACHE_LIMIT = 64 * 1024 * 1024  #bytes of mp3 kept on disk
+MEMORY_SOUNDS = 32  #decoded phrases kept ready in RAM
+VOICE_CHANNEL = 7
+
+_lock = threading.RLock()
+_sounds = OrderedDict()
+
+#content-addressed mp3 cache, least recently used files go first once over CACHE_LIMIT
+def cache_path(text, lang=LANG, tld=TLD):
+    key = hashlib.sha1(f"{lang}|{tld}|{text}".encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".mp3")
+
+def synthesize(text, lang=LANG, tld=TLD):
+    path = cache_path(text, lang, tld)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    gTTS(text=text, lang=lang, tld=tld).save(tmp)
+    os.replace(tmp, path)
+    evict()
+    return path
+
+def evict(limit=CACHE_LIMIT):
+    with _lock:
+        try:
+            entries = [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith(".mp3")]
+        except FileNotFoundError:
+            return
+        stats = [(os.stat(p), p) for p in entries]
+        total = sum(st.st_size for st, _ in stats)
+        for st, p in sorted(stats, key=lambda item: item[0].st_mtime):
+            if total <= limit:
+                break
+            os.remove(p)
+            total -= st.st_size
+
+def _mixer():
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    return pygame.mixer.Channel(VOICE_CHANNEL)
+
+#decoded sound for a phrase, synthesized only the first time it is ever said
+def load(text, lang=LANG, tld=TLD):
+    key = (text, lang, tld)
+    with _lock:
+        sound = _sounds.get(key)
+        if sound is not None:
+            _sounds.move_to_end(key)
+            return sound
+    path = synthesize(text, lang, tld)
+    _mixer()
+    sound = pygame.mixer.Sound(path)
+    with _lock:
+        _sounds[key] = sound
+        while len(_sounds) > MEMORY_SOUNDS:
+            _sounds.popitem(last=False)
+    return sound
+
+def play(sound, wait=True):
+    channel = _mixer()
+    channel.play(sound)
+    while wait and channel.get_busy():
+        time.sleep(0.02)
+
+def speak(text, lang=LANG, tld=TLD, wait=True):
+    play(load(text, lang, tld), wait)
+
+#speaks texts from a (possibly slow) iterator as they arrive: one thread pulls the texts,
+#one synthesizes, and this thread plays, so sentence n plays while n+1 is being made
+def speak_stream(texts, lang=LANG, tld=TLD, on_text=None):
+    pending = queue.Queue()
+    ready = queue.Queue(maxsize=3)
+    errors = []
+
+    def pull():
+        try:
+            for text in texts:
+                pending.put(text)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pending.put(None)
+
+    def synth():
+        while True:
+            text = pending.get()
+            if text is None:
+                break
+            try:
+                ready.put((text, load(text, lang, tld)))
+            except Exception as e:
+                errors.append(e)
+        ready.put(None)
+
+    threading.Thread(target=pull, daemon=True).start()
+    threading.Thread(target=synth, daemon=True).start()
+
+    spoken = []
+    while True:
+        item = ready.get()
+        if item is None:
+            break
+        text, sound = item
+        if on_text:
+            on_text(text)
+        play(sound)
+        spoken.append(text)
+    if errors:
+        raise errors[0]
+    return spoken
+
+def stop():
+    if pygame.mixer.get_init():
+        pygame.mixer.Channel(VOICE_CHANNEL).stop()
+
+#hands the output device back between apps, the stem mixer opens it through pyaudio and
+#a plain alsa device can't be open twice; the next phrase opens it again
+def close():
+    stop()
+    with _lock:
+        _sounds.clear()
+    if pygame.mixer.get_init():
+        pygame.mixer.quit()
+
+#warm the cache with stock phrases in the background
+def preload(phrases, lang=LANG, tld=TLD):
+    def run():
+        for text in phrases:
+            try:
+                load(text, lang, tld)
+            except Exception as e:
+                print("Could not preload phrase:", text, e)
+    threading.Thread(target=run, daemon=True).start()
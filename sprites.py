@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+from PIL import Image, ImageDraw
+
+WIDTH, HEIGHT = 128, 64
+EXPRESSIONS = ["neutral", "happy", "sad", "confused", "angry"]
+BLINK_HEIGHTS = [50, 40, 30, 20, 10]
+SPRITE_VERSION = 1  #bump when draw_expression changes
+CACHE_PATH = os.path.expanduser("~/.cache/bevr/sprites.npz")
+
+#eye draw
+def draw_expression(draw, expression, width=14, height=50):
+    radius = 4
+    top_margin = (64 - height) // 2
+    left_center_x = 26 + 7
+    right_center_x = 88 + 7
+
+    def eye_shape(x, y, w, h):
+        draw.pieslice((x, y, x + w, y + 2 * radius), 180, 360, fill=255)
+        draw.pieslice((x, y + h - 2 * radius, x + w, y + h), 0, 180, fill=255)
+        draw.rectangle((x, y + radius, x + w, y + h - radius), fill=255)
+
+    if expression == "neutral":  #neutral eyes
+        for cx in [left_center_x, right_center_x]:
+            eye_shape(cx - width // 2, top_margin, width, height)
+
+    elif expression == "happy":  #happy eyes
+        eye_size = 14
+        top = 20
+        offset = 6
+        for cx in [left_center_x, right_center_x]:
+            draw.polygon([(cx - eye_size, top + eye_size), (cx, top), (cx + eye_size, top + eye_size)], fill=255)
+            draw.polygon([(cx - eye_size + offset, top + eye_size), (cx, top + offset + 4), (cx + eye_size - offset, top + eye_size)], fill=0)
+
+    elif expression == "sad":  #sad eyes
+        eye_size = 14
+        top = 34
+        offset = 6
+        for cx in [left_center_x, right_center_x]:
+            draw.polygon([(cx - eye_size, top), (cx, top + eye_size), (cx + eye_size, top)], fill=255)
+            draw.polygon([(cx - eye_size + offset, top), (cx, top + eye_size - offset - 4), (cx + eye_size - offset, top)], fill=0)
+
+    elif expression == "confused":  #confused eyes
+        for cx in [left_center_x, right_center_x]:
+            for i in range(4):
+                offset = i * 2
+                draw.arc((cx - 6 + offset, 24 + offset, cx + 6 - offset, 36 - offset), 0, 360, fill=255)
+
+    elif expression == "angry":  #angry eyes
+        h = 30
+        top = (64 - h) // 2
+        for cx in [left_center_x, right_center_x]:
+            x = cx - width // 2
+            draw.rectangle((x, top, x + width, top + h), fill=255)
+        draw.line((left_center_x - 8, 20, left_center_x + 8, 28), fill=255, width=2)
+        draw.line((right_center_x - 8, 28, right_center_x + 8, 20), fill=255, width=2)
+
+    else:  #fallback
+        for cx in [left_center_x, right_center_x]:
+            eye_shape(cx - width // 2, top_margin, width, height)
+
+#one frame as a 1-bit PIL image
+def render(expression, height=50):
+    image = Image.new("1", (WIDTH, HEIGHT))
+    draw_expression(ImageDraw.Draw(image), expression, height=height)
+    return image
+
+#every expression and blink frame packed once into ready-to-blit page buffers
+class Sprites:
+    def __init__(self, screen, path=CACHE_PATH):
+        self.screen = screen
+        self.path = path
+        self.key = f"{screen.width}x{screen.height}-r{getattr(screen.device, 'rotate', 0)}-v{SPRITE_VERSION}"
+        self.frames = self._load()
+        if self.frames is None:
+            self.frames = self._build()
+            self._save()
+
+    def _build(self):
+        frames = {name: self.screen.pack(render(name)) for name in EXPRESSIONS}
+        for h in BLINK_HEIGHTS:
+            frames[f"blink{h}"] = self.screen.pack(render("neutral", height=h))
+        return frames
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                if str(data["key"]) != self.key:
+                    return None
+                return {name: data[name] for name in data.files if name != "key"}
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            np.savez(self.path, key=np.array(self.key), **self.frames)
+        except OSError as e:
+            print("Could not save sprite cache:", e)
+
+    #unknown names fall back to the neutral eyes, like draw_expression does
+    def expression(self, name):
+        return self.frames.get(name, self.frames["neutral"])
+
+    def blink(self):
+        return [self.frames[f"blink{h}"] for h in BLINK_HEIGHTS]
+
+    #blink down from neutral, then open on the target expression
+    def transition(self, name):
+        return self.blink() + [self.expression(name)]
+
+_sprites = None
+_lock = threading.Lock()
+
+def get_sprites():
+    global _sprites
+    with _lock:
+        if _sprites is None:
+            import display
+            _sprites = Sprites(display.get_display())
+        return _sprites
+
+#benchmark: PIL draw + pack per expression change vs cached buffer, optionally pushed to the panel
+#usage: python3 sprites.py [--oled]
+if __name__ == "__main__":
+    import display
+
+    class _PanelStub:
+        width, height, mode, size, rotate = WIDTH, HEIGHT, "1", (WIDTH, HEIGHT), 0
+        sent = 0
+        def preprocess(self, image):
+            return image
+        def command(self, *args):
+            pass
+        def data(self, data):
+            self.sent += len(data)
+
+    screen = display.get_display() if "--oled" in sys.argv else display.Display(_PanelStub())
+    cached = Sprites(screen, path=os.path.join("/tmp", "bevr_sprites_bench.npz"))
+    rounds = 200
+
+    def transition_draw(expression):
+        for h in BLINK_HEIGHTS:
+            with screen.canvas() as draw:
+                draw_expression(draw, "neutral", height=h)
+        with screen.canvas() as draw:
+            draw_expression(draw, expression)
+
+    def transition_cached(expression):
+        screen.play(cached.transition(expression))
+
+    for label, fn in [("draw", transition_draw), ("cached", transition_cached)]:
+        screen.invalidate()
+        sent = screen.bytes_sent
+        t0 = time.perf_counter()
+        for i in range(rounds):
+            fn(EXPRESSIONS[i % len(EXPRESSIONS)])
+        elapsed = time.perf_counter() - t0
+        print(f"{label:>6}: {elapsed / rounds * 1000:.2f} ms per transition, "
+              f"{(screen.bytes_sent - sent) / rounds:.0f} bytes pushed per transition")
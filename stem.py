@@ -1,112 +1,60 @@
 import cv2
-import mediapipe as mp
-import pygame
 import time
 import os
-import threading
-import serial
-import math
-import sys
-from picamera2 import Picamera2
-from luma.core.interface.serial import i2c
-from luma.oled.device import ssd1306
-from luma.core.render import canvas
 from PIL import ImageDraw
-
-FRAME_WIDTH, FRAME_HEIGHT = 640, 480
+import hardware
+import vision
+import preview
+import frameprep
+import gesture
+import display
+import stems
+import mixer
+import scheduler
+import servo
+import animations
+from host import exec_menu
+from pipeline import LatestQueue, Stage, StageStats
+
+FRAME_WIDTH, FRAME_HEIGHT = hardware.FRAME_WIDTH, hardware.FRAME_HEIGHT
 VOLUME_THRESHOLD = 0.1
-EXTENSION_FACTOR = 0.35
-SONGS_DIR = "/home/eyeay/Music/SONGS"
-
-stem_files = {
-    "vocals": "vocals.mp3",
-    "guitar": "guitar.mp3",
-    "drums": "drums.mp3",
-    "bass": "bass.mp3"
-}
+PIPELINED = os.environ.get("STEM_PIPELINED", "1") != "0"
+SHOW_STATS = os.environ.get("STEM_STATS", "0") != "0"  #STEM_STATS=1 prints stage timings and draws them on the preview
 
 stem_state = "selecting"
-current_song_index = 0
-last_pinch_time = 0
-pinch_count = 0
-pinch_detected = False
+current_song = None
 DOUBLE_PINCH_WINDOW = 1.5
 FIST_HOLD_DURATION = 3.0
-fist_start_time = None
-
-song_folders = [f for f in os.listdir(SONGS_DIR) if os.path.isdir(os.path.join(SONGS_DIR, f))]
-if not song_folders:
-    print("❌ No song folders found in:", SONGS_DIR)
-    sys.exit(1)
-
-ser = serial.Serial("/dev/ttyAMA0", 115200, timeout=1)
-time.sleep(2)
-oled_serial = i2c(port=1, address=0x3D)
-device = ssd1306(oled_serial)
-camera = Picamera2()
-camera.configure(camera.create_still_configuration(main={"size": (FRAME_WIDTH, FRAME_HEIGHT)}))
-camera.start()
-
-pygame.mixer.init()
-channels = {
-    "vocals": pygame.mixer.Channel(0),
-    "guitar": pygame.mixer.Channel(1),
-    "drums": pygame.mixer.Channel(2),
-    "bass": pygame.mixer.Channel(3)
-}
-
-def load_stems(index):
-    folder = os.path.join(SONGS_DIR, song_folders[index])
+stem_song = None
+events = None
+
+link = servo.get_link()
+device = hardware.get_device()
+screen = display.get_display()
+timelines = scheduler.get_scheduler()
+reader = vision.open_reader(hands=True)
+prep = frameprep.FramePrep()
+gestures = gesture.get_classifier()
+loader = stems.get_loader()
+player = mixer.get_mixer()
+
+#decoded in the background since the song was highlighted, so this rarely waits
+def load_stems(name):
     try:
-        return {
-            name: pygame.mixer.Sound(os.path.join(folder, filename))
-            for name, filename in stem_files.items()
-        }
+        return loader.get(name)
     except Exception as e:
-        print("❌ Failed to load stems from:", folder)
+        print("❌ Failed to load stems from:", loader.library.folder(name))
         print("Error:", e)
-        sys.exit(1)
-
-mp_hands = mp.solutions.hands
-mp_drawing = mp.solutions.drawing_utils
-hands_detector = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7, max_num_hands=1)
-
-def move_servos(pan, tilt, left, right):
-    command = f"{int(pan)},{int(tilt)},{int(left)},{int(right)}\n"
-    ser.write(command.encode("utf-8"))
-
-def dance_animation():
-    t = 0
-    while stem_state == "playing":
-        tilt = 80 + 5 * math.sin(t)
-        left_wave = (math.sin(t) + 1) / 2
-        left_arm = int(65 + left_wave * (180 - 65))
-        right_wave = 1 - left_wave
-        right_arm = int(0 + right_wave * (115 - 0))
-        move_servos(90, int(tilt), left_arm, right_arm)
-        time.sleep(0.05)
-        t += 0.1
-
-def is_fist(lm):
-    return all(lm[tip].y > lm[pip].y for tip, pip in [(8,6), (12,10), (16,14), (20,18)]) and lm[4].x < lm[3].x
-
-def is_pinch(lm):
-    dist = math.hypot(lm[4].x - lm[8].x, lm[4].y - lm[8].y)
-    return dist < 0.05
-
-def compute_finger_volume(lm, pip_idx, tip_idx, height):
-    pip_y = lm[pip_idx].y * FRAME_HEIGHT
-    tip_y = lm[tip_idx].y * FRAME_HEIGHT
-    return max(0.0, min(1.0, (pip_y - tip_y) / (height * EXTENSION_FACTOR)))
+        return None
 
 def show_oled_song(name):
     name = name.replace("_", " ").title()
-    with canvas(device) as draw:
+    with screen.canvas() as draw:
         draw.text((5, 20), "Select Song:", fill=255)
         draw.text((5, 40), name[:20], fill=255)
 
 def show_volume_bars(volumes):
-    with canvas(device) as draw:
+    with screen.canvas() as draw:
         bar_width = 10
         max_height = 40
         spacing = 15
@@ -123,88 +71,182 @@ def show_volume_bars(volumes):
             label_x = x + (bar_width // 2) - 3
             draw.text((label_x, 10), label, fill=255)
 
-def main():
-    global stem_state, current_song_index, last_pinch_time, pinch_count, pinch_detected
-    global fist_start_time
-
-    show_oled_song(song_folders[current_song_index])
-    stem_sounds = {}
-
+#pinch: next song, double pinch: play it, hold a fist: back to the menu
+#the song list is rescanned on every pinch so folders added while running show up
+def next_song(event):
+    global current_song
+    songs = loader.library.songs()
+    if stem_state == "selecting" and songs:
+        index = songs.index(current_song) + 1 if current_song in songs else 0
+        current_song = songs[index % len(songs)]
+        loader.prefetch(current_song)
+        return ("song", current_song)
+
+def play_song(event):
+    global stem_state, stem_song
+    if stem_state == "selecting" and current_song:
+        stem_song = load_stems(current_song)
+        if stem_song is None:
+            return None
+        player.play(stem_song)
+        stem_state = "playing"
+        timelines.play("servos", animations.dance_keyframes(grid=stem_song.grid, position=player.position))
+
+def start(host=None):
+    global stem_state, current_song, events
+    stem_state = "selecting"
+    songs = loader.library.songs()
+    current_song = songs[0] if songs else None
+    if current_song:
+        loader.prefetch(current_song)
+    events = gesture.GestureEvents(double_tap=DOUBLE_PINCH_WINDOW)
+    events.on("tap", "pinch", next_song)
+    events.on("double_tap", "pinch", play_song)
+    events.on("hold", "fist", lambda event: "menu", seconds=FIST_HOLD_DURATION)
+
+def stop(host=None):
+    global stem_state, stem_song
+    stem_state = "stopped"
+    timelines.cancel("servos")
+    player.stop()
+    stem_song = None
+    preview.close()
+
+#gesture + audio step for one frame, returns (exit reason, oled update, volumes)
+def update(frame):
+    oled = None
+    volumes = None
+    if not frame.hands:
+        events.update(None)
+        return None, oled, volumes
+
+    feats = gesture.features(frame.hands[0])
+    for result in events.update(gesture.label(feats, gestures)):
+        if result == "menu":
+            return "menu", oled, volumes
+        oled = result
+
+    if stem_state == "playing":
+        #index, middle, ring, pinky
+        volumes = dict(zip(stems.STEM_FILES, gesture.volumes(feats).tolist()))
+        player.set_gains(volumes)
+        oled = ("bars", volumes)
+
+    return None, oled, volumes
+
+def show_oled(oled):
+    kind, value = oled
+    if kind == "song":
+        show_oled_song(value)
+    else:
+        show_volume_bars(value)
+
+def render(frame, volumes, stats=None):
+    display_frame = prep.bgr(frame.image)
+    if frame.hands:
+        vision.draw_hand(display_frame, frame.hands[0])
+    if volumes:
+        y = 50
+        for name, vol in volumes.items():
+            cv2.putText(display_frame, f"{name}: {vol:.2f}", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            y += 30
+    if stats:
+        y = FRAME_HEIGHT - 10 - 18 * (len(stats) - 1)
+        for line in stats:
+            cv2.putText(display_frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+            y += 18
+    return display_frame
+
+def run_serial():
     while True:
-        frame = camera.capture_array("main")
-        frame = cv2.flip(frame, 1)
-        display_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        results = hands_detector.process(frame)
-
-        if results.multi_hand_landmarks:
-            hand = results.multi_hand_landmarks[0]
-            lm = hand.landmark
-            mp_drawing.draw_landmarks(display_frame, hand, mp_hands.HAND_CONNECTIONS)
-
-            if is_fist(lm):
-                if fist_start_time is None:
-                    fist_start_time = time.time()
-                elif time.time() - fist_start_time >= FIST_HOLD_DURATION:
-                    camera.stop()
-                    time.sleep(1)
-                    cv2.destroyAllWindows()
-                    pygame.mixer.quit()
-                    ser.close()
-                    os.execvp("python3", ["python3", "/home/eyeay/app_menu.py"])
-            else:
-                fist_start_time = None
-
-            if is_pinch(lm):
-                if not pinch_detected:
-                    pinch_detected = True
-                    now = time.time()
-                    if now - last_pinch_time < DOUBLE_PINCH_WINDOW:
-                        pinch_count += 1
-                    else:
-                        pinch_count = 1
-                    last_pinch_time = now
-
-                    if stem_state == "selecting":
-                        if pinch_count == 1:
-                            current_song_index = (current_song_index + 1) % len(song_folders)
-                            show_oled_song(song_folders[current_song_index])
-                        elif pinch_count >= 2:
-                            stem_sounds = load_stems(current_song_index)
-                            for name, sound in stem_sounds.items():
-                                channels[name].play(sound, loops=-1)
-                            stem_state = "playing"
-                            threading.Thread(target=dance_animation, daemon=True).start()
-                            pinch_count = 0
-            else:
-                pinch_detected = False
-
-            if stem_state == "playing":
-                y_coords = [int(l.y * FRAME_HEIGHT) for l in lm]
-                height = max(y_coords) - min(y_coords) or 1
-                volumes = {
-                    "vocals": compute_finger_volume(lm, 6, 8, height),
-                    "guitar": compute_finger_volume(lm, 10, 12, height),
-                    "drums": compute_finger_volume(lm, 14, 16, height),
-                    "bass": compute_finger_volume(lm, 18, 20, height),
-                }
-                for name, ch in channels.items():
-                    ch.set_volume(volumes[name])
-                show_volume_bars(volumes)
-
-                y = 50
-                for name, vol in volumes.items():
-                    cv2.putText(display_frame, f"{name}: {vol:.2f}", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    y += 30
-
-        cv2.imshow("Stem Player", display_frame)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
+        frame = reader.read(copy=False)
+        if frame is None:
+            continue
+        reason, oled, volumes = update(frame)
+        if reason:
+            return reason
+        if oled:
+            show_oled(oled)
+
+        if preview.wanted():
+            preview.show("Stem Player", render(frame, volumes))
+        if preview.key() == ord("q"):
             break
         time.sleep(0.01)
 
-    camera.stop()
-    pygame.mixer.quit()
-    ser.close()
-    cv2.destroyAllWindows()
+    return None
+
+#capture and inference run in the vision service, here control/audio and the OLED push
+#get their own threads so the I2C transfer never holds up the next frame
+def run_pipelined():
+    oled_queue = LatestQueue()
+    window_queue = LatestQueue()
+    exit_reason = []
+
+    #control only needs the hands, so it reads a view of the bus; the window stage runs on
+    #another thread while the bus slot gets recycled, so it gets a copy, and only of the
+    #frames that will be shown
+    def control():
+        frame = reader.read(timeout=0.1, copy=False)
+        if frame is None:
+            return None
+        reason, oled, volumes = update(frame)
+        if reason:
+            exit_reason.append(reason)
+        if oled:
+            oled_queue.put(oled)
+        image = frame.image.copy() if preview.wanted() else None
+        return frame._replace(image=image), volumes
+
+    stages = [
+        Stage("control", control, outbox=window_queue, stamp=lambda item: item[0].timestamp),
+        Stage("oled", show_oled, inbox=oled_queue),
+    ]
+    window_stats = StageStats("window")
+    for stage in stages:
+        stage.start()
+
+    last_report = time.time()
+    stats = []
+    try:
+        while not exit_reason:
+            item = window_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            started = time.time()
+            frame, volumes = item
+            if frame.image is not None:
+                preview.show("Stem Player", render(frame, volumes, stats if SHOW_STATS else None))
+            if preview.key() == ord("q"):
+                break
+            window_stats.record(started, frame.timestamp)
+
+            if time.time() - last_report >= 2.0:
+                stats = reader.bus.stage_stats() + [str(stage.stats) for stage in stages] + [str(window_stats), screen.stats(), link.stats(), player.stats()]
+                if SHOW_STATS:
+                    print(" | ".join(stats))
+                last_report = time.time()
+    finally:
+        for stage in stages:
+            stage.stop()
+
+    return exit_reason[0] if exit_reason else None
+
+def main():
+    if not current_song:
+        print("❌ No song folders found in:", loader.library.path)
+        return "menu"
+    show_oled_song(current_song)
+    if PIPELINED:
+        return run_pipelined()
+    return run_serial()
 
 if __name__ == "__main__":
-    main()
+    start()
+    reason = main()
+    stop()
+    player.close()
+    vision.stop_service()
+    if reason == "menu":
+        exec_menu()
+    hardware.close_all()
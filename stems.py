@@ -0,0 +1,222 @@
+import os
+import time
+import subprocess
+import threading
+from collections import OrderedDict
+import numpy as np
+from pipeline import LatestQueue
+import beats
+
+SONGS_DIR = "/home/eyeay/Music/SONGS"
+STEM_FILES = {
+    "vocals": "vocals.mp3",
+    "guitar": "guitar.mp3",
+    "drums": "drums.mp3",
+    "bass": "bass.mp3",
+}
+RATE = 44100  #pcm is decoded to this rate and the mixer opens its stream at it
+CHANNELS = 2
+CACHE_DIR = os.path.expanduser("~/.cache/bevr/stems")
+DISK_LIMIT = 2 * 1024 * 1024 * 1024  #bytes of decoded pcm kept on disk, ~4 MB per stem-minute
+#bytes of songs kept mapped and ready to play; this bounds the open mappings, not memory,
+#the kernel pages the pcm in and out of the page cache as the mixer streams it
+MAPPED_LIMIT = 384 * 1024 * 1024
+WARM_SECONDS = 5.0  #read ahead of playback so the first blocks never wait on the sd card
+
+#song folders, listed again whenever the directory changes
+class Library:
+    def __init__(self, path=SONGS_DIR):
+        self.path = path
+        self.mtime = None
+        self.names = []
+
+    def songs(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self.mtime, self.names = None, []
+            return self.names
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.names = sorted(f for f in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, f)))
+        return self.names
+
+    def folder(self, name):
+        return os.path.join(self.path, name)
+
+class Song:
+    def __init__(self, name, rate, pcm):
+        self.name = name
+        self.rate = rate
+        self.pcm = pcm  #stem name -> (frames, channels) int16, memory-mapped
+        self.frames = min(len(a) for a in pcm.values())
+        self.nbytes = sum(a.nbytes for a in pcm.values())
+        self.grid = None
+
+    #pulls the start of every stem into the page cache, the mixer streams the rest
+    def warm(self, seconds=WARM_SECONDS):
+        frames = int(seconds * self.rate)
+        for a in self.pcm.values():
+            np.asarray(a[:frames]).max()
+
+_disk_lock = threading.Lock()
+
+#mp3 to (frames, CHANNELS) int16 with ffmpeg, no audio device involved
+def decode(source, rate=RATE, channels=CHANNELS):
+    out = subprocess.run(["ffmpeg", "-v", "error", "-i", source, "-f", "s16le", "-ac", str(channels), "-ar", str(rate), "-"],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    return np.frombuffer(out, np.int16).reshape(-1, channels)
+
+#decoded pcm of one stem, decoded from mp3 once per rate and then memory-mapped;
+#least recently played songs go first once the cache is over DISK_LIMIT
+def pcm_path(song, stem, rate):
+    return os.path.join(CACHE_DIR, song, f"{stem}.{rate}.npy")
+
+def load_pcm(folder, song, stem, filename, rate):
+    source = os.path.join(folder, filename)
+    path = pcm_path(song, stem, rate)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+        os.utime(path)
+    else:
+        pcm = decode(source, rate)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp, pcm)
+        os.replace(tmp, path)
+    return np.load(path, mmap_mode="r")
+
+#whole songs at a time, songs in keep (the ones mapped right now) are never removed
+def evict(limit=DISK_LIMIT, keep=()):
+    with _disk_lock:
+        try:
+            songs = os.listdir(CACHE_DIR)
+        except FileNotFoundError:
+            return
+        entries = []
+        for song in songs:
+            folder = os.path.join(CACHE_DIR, song)
+            if not os.path.isdir(folder):
+                continue
+            files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".npy")]
+            stats = [os.stat(f) for f in files]
+            if files:
+                entries.append((max(st.st_mtime for st in stats), song, files, sum(st.st_size for st in stats)))
+        total = sum(size for _, _, _, size in entries)
+        for _, song, files, size in sorted(entries):
+            if total <= limit:
+                break
+            if song in keep:
+                continue
+            for f in files:
+                os.remove(f)
+            total -= size
+            print("Evicted decoded", song)
+
+#beat grid cached next to the stems, or beside the pcm when the song folder is read-only;
+#a song that can't be analysed still plays, it just gets the plain dance
+def load_grid(song, folder):
+    sources = [os.path.join(folder, filename) for filename in STEM_FILES.values()]
+    paths = [os.path.join(folder, beats.CACHE_FILE), os.path.join(CACHE_DIR, song.name, beats.CACHE_FILE)]
+    try:
+        return beats.get_grid(song, sources, paths)
+    except Exception as e:
+        print("Could not analyse", song.name, e)
+        return None
+
+#decodes songs in the background as soon as they are highlighted and keeps the most
+#recently used ones mapped, up to MAPPED_LIMIT, ready to start without a pause
+class StemLoader(threading.Thread):
+    def __init__(self, library, limit=MAPPED_LIMIT):
+        super().__init__(name="stems", daemon=True)
+        self.library = library
+        self.limit = limit
+        self.requests = LatestQueue()
+        self.cache = OrderedDict()
+        self.loading = set()
+        self.cond = threading.Condition()
+        self.running = True
+
+    #start decoding a song nobody has asked to play yet, newer requests replace older ones
+    def prefetch(self, name):
+        with self.cond:
+            if name in self.cache or name in self.loading:
+                return
+        self.requests.put(name)
+
+    #the decoded song, decoding it here if the background thread hasn't got to it
+    def get(self, name, timeout=30.0):
+        deadline = time.time() + timeout
+        with self.cond:
+            while name in self.loading and time.time() < deadline:
+                self.cond.wait(0.1)
+            song = self.cache.get(name)
+            if song is not None:
+                self.cache.move_to_end(name)
+                return song
+        return self._load(name)
+
+    def run(self):
+        while self.running:
+            name = self.requests.get(timeout=0.5)
+            if name is None:
+                continue
+            try:
+                self._load(name)
+            except Exception as e:
+                print("Could not preload", name, e)
+
+    def _load(self, name):
+        with self.cond:
+            if name in self.cache:
+                return self.cache[name]
+            self.loading.add(name)
+        try:
+            t0 = time.time()
+            folder = self.library.folder(name)
+            pcm = {stem: load_pcm(folder, name, stem, filename, RATE) for stem, filename in STEM_FILES.items()}
+            song = Song(name, RATE, pcm)
+            song.warm()
+            song.grid = load_grid(song, folder)
+            print(f"Loaded {name} in {time.time() - t0:.1f}s ({song.nbytes // (1024 * 1024)} MB)")
+            with self.cond:
+                self.cache[name] = song
+                self._evict()
+                keep = set(self.cache) | self.loading
+            evict(keep=keep)
+            return song
+        finally:
+            with self.cond:
+                self.loading.discard(name)
+                self.cond.notify_all()
+
+    def _evict(self):
+        total = sum(song.nbytes for song in self.cache.values())
+        while total > self.limit and len(self.cache) > 1:
+            _, song = self.cache.popitem(last=False)
+            total -= song.nbytes
+
+    def stop(self):
+        self.running = False
+        self.join(timeout=1)
+
+_loader = None
+_lock = threading.Lock()
+
+def get_loader(path=SONGS_DIR):
+    global _loader
+    with _lock:
+        if _loader is None:
+            _loader = StemLoader(Library(path))
+            _loader.start()
+        return _loader
+
+#time to get each song ready: first run decodes the mp3s, later runs map the cached pcm
+#usage: python3 stems.py [song ...]
+if __name__ == "__main__":
+    import sys
+    library = Library()
+    loader = StemLoader(library)
+    for name in sys.argv[1:] or library.songs():
+        t0 = time.time()
+        loader.get(name)
+        print(f"{name}: {time.time() - t0:.2f}s")
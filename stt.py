@@ -0,0 +1,97 @@
+import os
+import json
+import threading
+import speech_recognition as sr
+
+#google, vosk, or auto: vosk when it is installed and its model is on disk, google otherwise
+STT_BACKEND = os.environ.get("BEVR_STT", "auto")
+VOSK_MODEL = os.environ.get("VOSK_MODEL", os.path.expanduser("~/models/vosk-model-small-en-us-0.15"))
+
+#backends turn an sr.AudioData into text and raise sr.UnknownValueError / sr.RequestError
+#like recognize_google does; streaming ones can also decode chunks while someone is talking
+class GoogleBackend:
+    name = "google"
+    streaming = False
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio, grammar=None):
+        return self.recognizer.recognize_google(audio)
+
+class VoskBackend:
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path=VOSK_MODEL):
+        import vosk
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    #grammar limits the recognizer to a short word list, anything else comes back empty
+    def recognizer(self, sample_rate, grammar=None):
+        if grammar:
+            return self.vosk.KaldiRecognizer(self.model, sample_rate, json.dumps(list(grammar) + ["[unk]"]))
+        return self.vosk.KaldiRecognizer(self.model, sample_rate)
+
+    def transcribe(self, audio, grammar=None):
+        rec = self.recognizer(audio.sample_rate, grammar)
+        rec.AcceptWaveform(audio.get_raw_data(convert_width=2))
+        text = result_text(rec.FinalResult())
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def stream(self, sample_rate, grammar=None):
+        return VoskStream(self.recognizer(sample_rate, grammar))
+
+#text of a vosk result or partial result json, with unknown-word markers dropped
+def result_text(result, key="text"):
+    return json.loads(result).get(key, "").replace("[unk]", "").strip()
+
+#incremental decode of one utterance, feed() returns the best guess so far
+class VoskStream:
+    def __init__(self, rec):
+        self.rec = rec
+        self.parts = []
+
+    def feed(self, chunk):
+        if self.rec.AcceptWaveform(chunk):
+            text = result_text(self.rec.Result())
+            if text:
+                self.parts.append(text)
+            return " ".join(self.parts)
+        return " ".join(self.parts + [result_text(self.rec.PartialResult(), "partial")]).strip()
+
+    def result(self):
+        text = result_text(self.rec.FinalResult())
+        return " ".join(self.parts + [text]).strip()
+
+_backend = None
+_lock = threading.Lock()
+
+def get_backend(name=STT_BACKEND):
+    global _backend
+    with _lock:
+        if _backend is None:
+            if name in ("vosk", "auto"):
+                try:
+                    _backend = VoskBackend()
+                except Exception as e:
+                    if name == "vosk":
+                        raise
+                    print("Offline speech recognition unavailable, using Google:", e)
+            if _backend is None:
+                _backend = GoogleBackend()
+            print("Speech recognition:", _backend.name)
+        return _backend
+
+#text for an utterance, reusing the transcript the listener decoded while it was spoken
+def recognize(audio, backend=None, grammar=None):
+    text = getattr(audio, "text", None)
+    if text is None:
+        text = (backend or get_backend()).transcribe(audio, grammar)
+    if not text:
+        raise sr.UnknownValueError()
+    return text
@@ -0,0 +1,340 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import cv2
+import hardware
+import frameprep
+from pipeline import LatestQueue, Stage, StageStats
+
+BUS_NAME = "bevr_frames"
+SLOTS = 3
+MAX_HANDS = 2
+MAX_FACES = 4
+DEMAND_TIMEOUT = 0.5
+DEMAND_ONCE = 0.05  #how far ahead a pending one-off request is renewed, it is dropped once answered
+STALE_AFTER = 2.0
+STAGES = ["capture", "inference"]
+#what the hand model looks at: full = the whole frame, small = a low-res copy,
+#roi = the low-res copy until a hand is found, then a full-res crop that follows it
+HANDS_MODE = os.environ.get("BEVR_HANDS", "roi")
+SMALL_WIDTH, SMALL_HEIGHT = hardware.LORES_WIDTH, hardware.LORES_HEIGHT
+ROI_MARGIN = 0.3  #added on every side of the hand's box, as a share of its size
+ROI_MIN = 128  #pixels, smallest crop side
+
+HAND_CONNECTIONS = [
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (5, 9), (9, 10), (10, 11), (11, 12),
+    (9, 13), (13, 14), (14, 15), (15, 16),
+    (13, 17), (17, 18), (18, 19), (19, 20), (0, 17),
+]
+
+Point = namedtuple("Point", "x y z")
+#hands: list of (21, 3) arrays, faces: list of (xmin, ymin, width, height, score), None when not computed
+Frame = namedtuple("Frame", "seq timestamp image hands faces")
+
+#shared memory layout, info always sits at offset 0 so readers can find the frame size
+def _layout(width, height):
+    fields = [
+        ("info", np.int64, (4,)),  #latest seq, width, height, spare
+        ("clock", np.float64, (3,)),  #service heartbeat, last hands demand, last faces demand
+        ("stats", np.float64, (len(STAGES), 3)),  #fps, busy ms, age ms per service stage
+        ("slot_seq", np.int64, (SLOTS,)),
+        ("stamp", np.float64, (SLOTS,)),
+        ("n_hands", np.int32, (SLOTS,)),
+        ("n_faces", np.int32, (SLOTS,)),
+        ("hands", np.float32, (SLOTS, MAX_HANDS, 21, 3)),
+        ("faces", np.float32, (SLOTS, MAX_FACES, 5)),
+        ("image", np.uint8, (SLOTS, height, width, 3)),
+    ]
+    layout = {}
+    offset = 0
+    for name, dtype, shape in fields:
+        offset = (offset + 63) // 64 * 64
+        layout[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+class FrameBus:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        info = np.ndarray((4,), np.int64, shm.buf)
+        layout, _ = _layout(int(info[1]), int(info[2]))
+        for name, (offset, dtype, shape) in layout.items():
+            setattr(self, name, np.ndarray(shape, dtype, shm.buf, offset))
+
+    @classmethod
+    def create(cls, width=hardware.FRAME_WIDTH, height=hardware.FRAME_HEIGHT, name=BUS_NAME):
+        _, size = _layout(width, height)
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        info = np.ndarray((4,), np.int64, shm.buf)
+        info[:] = (0, width, height, 0)
+        bus = cls(shm, owner=True)
+        bus.slot_seq[:] = -1
+        bus.clock[:] = (time.time(), 0, 0)
+        return bus
+
+    @classmethod
+    def attach(cls, name=BUS_NAME):
+        shm = shared_memory.SharedMemory(name=name)
+        #attached segments must not be unlinked by this process' tracker on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    def alive(self):
+        return time.time() - float(self.clock[0]) < STALE_AFTER
+
+    #writer side
+    def begin(self):
+        slot = (int(self.info[0]) + 1) % SLOTS
+        self.slot_seq[slot] = -1
+        return slot, self.image[slot]
+
+    def commit(self, slot, hands=None, faces=None):
+        seq = int(self.info[0]) + 1
+        if hands is None:
+            self.n_hands[slot] = -1
+        else:
+            hands = hands[:MAX_HANDS]
+            for i, hand in enumerate(hands):
+                self.hands[slot, i] = hand
+            self.n_hands[slot] = len(hands)
+        if faces is None:
+            self.n_faces[slot] = -1
+        else:
+            faces = faces[:MAX_FACES]
+            for i, face in enumerate(faces):
+                self.faces[slot, i] = face
+            self.n_faces[slot] = len(faces)
+        self.stamp[slot] = time.time()
+        self.slot_seq[slot] = seq
+        self.info[0] = seq
+
+    def wants(self, index):
+        return time.time() - float(self.clock[index]) < DEMAND_TIMEOUT
+
+    def publish_stats(self, index, stats):
+        self.stats[index] = (stats.fps, stats.busy_ms, stats.age_ms)
+
+    def stage_stats(self):
+        return [f"{name}: {fps:.1f} fps {busy:.1f} ms +{age:.0f} ms"
+                for name, (fps, busy, age) in zip(STAGES, self.stats)]
+
+    #reader side, retried if the writer recycled the slot while we were copying
+    def read(self, copy=True):
+        for _ in range(3):
+            seq = int(self.info[0])
+            if seq == 0:
+                return None
+            slot = seq % SLOTS
+            image = self.image[slot].copy() if copy else self.image[slot]
+            if not copy:
+                #a view into shared memory other processes read too, never write through it
+                image.flags.writeable = False
+            n_hands = int(self.n_hands[slot])
+            n_faces = int(self.n_faces[slot])
+            hands = None if n_hands < 0 else [self.hands[slot, i].copy() for i in range(n_hands)]
+            faces = None if n_faces < 0 else [tuple(float(v) for v in self.faces[slot, i]) for i in range(n_faces)]
+            stamp = float(self.stamp[slot])
+            if int(self.slot_seq[slot]) == seq:
+                return Frame(seq, stamp, image, hands, faces)
+        return None
+
+    def close(self):
+        for name in ("info", "clock", "stats", "slot_seq", "stamp", "n_hands", "n_faces", "hands", "faces", "image"):
+            setattr(self, name, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+#one capture + inference pipeline feeding every consumer, the capture stage keeps
+#grabbing while inference runs so a slow model never leaves the camera idle
+class VisionService(threading.Thread):
+    def __init__(self, bus, hands_mode=HANDS_MODE):
+        super().__init__(daemon=True)
+        self.bus = bus
+        self.running = True
+        self.hands_mode = hands_mode
+        self.frames = LatestQueue()
+        self.capture = Stage("capture", self._grab, outbox=self.frames, stamp=lambda item: item[0])
+        self.stats = StageStats("inference")
+        self.small = np.empty((SMALL_HEIGHT, SMALL_WIDTH, 3), np.uint8)
+        self.small_raw = np.empty_like(self.small)
+        self.roi = None
+
+    def _grab(self):
+        camera = hardware.get_camera()
+        if hardware.LORES and self.hands_mode != "full":
+            (raw, lores), _ = camera.capture_arrays(["main", "lores"])
+            return time.time(), raw, lores
+        return time.time(), camera.capture_array("main"), None
+
+    #low-res mirrored rgb, straight from the camera's lores stream when there is one
+    def _small(self, image, lores):
+        if lores is not None:
+            if hardware.MIRRORED:
+                return cv2.cvtColor(lores, cv2.COLOR_YUV2RGB_I420, dst=self.small)
+            cv2.cvtColor(lores, cv2.COLOR_YUV2RGB_I420, dst=self.small_raw)
+            return cv2.flip(self.small_raw, 1, dst=self.small)
+        return cv2.resize(image, (SMALL_WIDTH, SMALL_HEIGHT), dst=self.small, interpolation=cv2.INTER_AREA)
+
+    #crop around the last hand, in full-frame pixels
+    def _track(self, hand, width, height):
+        x0, y0 = hand[:, :2].min(axis=0)
+        x1, y1 = hand[:, :2].max(axis=0)
+        size = max((x1 - x0) * width, (y1 - y0) * height) * (1 + 2 * ROI_MARGIN)
+        size = int(min(max(size, ROI_MIN), width, height))
+        cx, cy = (x0 + x1) / 2 * width, (y0 + y1) / 2 * height
+        left = int(min(max(cx - size / 2, 0), width - size))
+        top = int(min(max(cy - size / 2, 0), height - size))
+        return left, top, left + size, top + size
+
+    def _hands(self, detector, image, lores):
+        height, width, _ = image.shape
+        roi = self.roi if self.hands_mode == "roi" else None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            source = np.ascontiguousarray(image[y0:y1, x0:x1])
+        elif self.hands_mode == "full":
+            source = image
+        else:
+            source = self._small(image, lores)
+
+        results = detector.process(source)
+        hands = [np.array([(l.x, l.y, l.z) for l in hand.landmark], np.float32)
+                 for hand in results.multi_hand_landmarks or []]
+        if roi is not None:
+            #crop-relative landmarks back to the whole frame
+            scale = np.array([(x1 - x0) / width, (y1 - y0) / height, (x1 - x0) / width], np.float32)
+            offset = np.array([x0 / width, y0 / height, 0.0], np.float32)
+            hands = [hand * scale + offset for hand in hands]
+        if self.hands_mode == "roi":
+            self.roi = self._track(hands[0], width, height) if hands else None
+        return hands
+
+    def run(self):
+        hands_detector = hardware.get_hands()
+        self.capture.start()
+        while self.running:
+            item = self.frames.get(timeout=0.5)
+            if item is None:
+                continue
+            started = time.time()
+            captured, raw, lores = item
+            slot, image = self.bus.begin()
+            np.copyto(image, raw[:, :, :3] if hardware.MIRRORED else raw[:, ::-1, :3])
+            self.bus.clock[0] = time.time()
+
+            hands = None
+            if self.bus.wants(1):
+                hands = self._hands(hands_detector, image, lores)
+            else:
+                self.roi = None
+
+            faces = None
+            if self.bus.wants(2):
+                results = hardware.get_face_detector().process(image)
+                faces = []
+                for detection in results.detections or []:
+                    box = detection.location_data.relative_bounding_box
+                    faces.append((box.xmin, box.ymin, box.width, box.height, detection.score[0]))
+
+            self.bus.commit(slot, hands, faces)
+            self.stats.record(started, captured)
+            self.bus.publish_stats(0, self.capture.stats)
+            self.bus.publish_stats(1, self.stats)
+
+    def stop(self):
+        self.running = False
+        self.capture.stop()
+        self.join(timeout=2)
+        self.bus.close()
+
+class FrameReader:
+    def __init__(self, bus, hands=True, faces=False):
+        self.bus = bus
+        self.hands = hands
+        self.faces = faces
+        self.last_seq = 0
+        self.face_request = False
+        self.meter = frameprep.meter()
+
+    #blocks until a frame newer than the last one read, None on timeout;
+    #detect_faces=True asks for face detection until a frame that has it has been read,
+    #however long the caller takes between reads
+    def read(self, timeout=1.0, copy=True, detect_faces=None):
+        now = time.time()
+        if self.hands:
+            self.bus.clock[1] = now
+        if detect_faces is None and self.faces:
+            self.bus.clock[2] = now
+        elif detect_faces:
+            self.face_request = True
+        deadline = now + timeout
+        while True:
+            if self.face_request:
+                self.bus.clock[2] = max(float(self.bus.clock[2]), time.time() - DEMAND_TIMEOUT + DEMAND_ONCE)
+            frame = self.bus.read(copy)
+            if frame is not None and frame.seq != self.last_seq:
+                self.last_seq = frame.seq
+                if frame.faces is not None:
+                    self.face_request = False
+                if self.meter:
+                    self.meter.tick()
+                return frame
+            if time.time() > deadline:
+                return None
+            time.sleep(0.002)
+
+    def close(self):
+        if not self.bus.owner:
+            self.bus.close()
+
+_service = None
+
+def start_service():
+    global _service
+    if _service is None:
+        _service = VisionService(FrameBus.create())
+        _service.start()
+    return _service
+
+def stop_service():
+    global _service
+    if _service is not None:
+        _service.stop()
+        _service = None
+
+#attach to a running service (e.g. the app host) or start one in this process
+def open_reader(hands=True, faces=False):
+    if _service is not None:
+        return FrameReader(_service.bus, hands, faces)
+    try:
+        bus = FrameBus.attach()
+        if bus.alive():
+            return FrameReader(bus, hands, faces)
+        bus.close()
+    except FileNotFoundError:
+        pass
+    return FrameReader(start_service().bus, hands, faces)
+
+def points(hand):
+    return [Point(float(x), float(y), float(z)) for x, y, z in hand]
+
+def draw_hand(image, hand):
+    h, w = image.shape[:2]
+    pts = [(int(x * w), int(y * h)) for x, y, _ in hand]
+    for a, b in HAND_CONNECTIONS:
+        cv2.line(image, pts[a], pts[b], (224, 224, 224), 2)
+    for p in pts:
+        cv2.circle(image, p, 3, (0, 0, 255), -1)